@@ -1,12 +1,9 @@
 import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 import heapq
-
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
-
+import itertools
 
 class Direction(Enum):
     RIGHT = 1
@@ -30,40 +27,58 @@ SPEED = 20
 
 class SnakeGame:
 
-    def __init__(self, w=640, h=480):
+    def __init__(self, w=640, h=480, seed=None, render=True):
         self.w = w
         self.h = h
-        self.display = pygame.display.set_mode((self.w, self.h))
-        pygame.display.set_caption('Snake')
-        self.clock = pygame.time.Clock()
+        self.rng = random.Random(seed)
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        # render=False plays without a window, events or frame rate limit, for batch runs like tournament.py
+        self.render = render
+        if self.render:
+            pygame.init()
+            self.font = pygame.font.Font('arial.ttf', 25)
+            self.display = pygame.display.set_mode((self.w, self.h))
+            pygame.display.set_caption('Snake')
+            self.clock = pygame.time.Clock()
         self.direction = Direction.RIGHT
         self.head = Point(self.w / 2, self.h / 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        # Number of snake pieces on each cell, kept in sync with self.snake
+        self.occupancy = bytearray(self.cols * self.rows)
+        # Unoccupied cells in any order plus each cell's position in that list (-1 if occupied)
+        self.free_cells = list(range(self.cols * self.rows))
+        self.free_pos = list(range(self.cols * self.rows))
+        for pt in self.snake:
+            self._occupy(pt)
         self.score = 0
         self.food = None
         self._place_food()
 
     def _place_food(self):
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        # Board is full, nothing left to eat
+        if not self.free_cells:
+            self.food = None
+            return
+        cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
 
     def play_step(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+        if self.render:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
 
         # Remove the tail before updating the head
-        self.snake.pop()
+        self._vacate(self.snake.pop())
 
         # Move the head
         self._move(self.direction)
-        self.snake.insert(0, self.head)
+        self.snake.appendleft(self.head)
+        self._occupy(self.head)
 
         game_over = False
         if self._is_collision():
@@ -75,9 +90,15 @@ class SnakeGame:
             self._place_food()
             # Add a new segment to the snake
             self.snake.append(Point(self.snake[-1].x, self.snake[-1].y))
-
-        self._update_ui()
-        self.clock.tick(SPEED)
+            self._occupy(self.snake[-1])
+            # The snake fills the whole board, nothing is left to play for
+            if self.food is None:
+                game_over = True
+                return game_over, self.score
+
+        if self.render:
+            self._update_ui()
+            self.clock.tick(SPEED)
         return game_over, self.score
 
     def _is_collision(self):
@@ -85,12 +106,36 @@ class SnakeGame:
                 self.head.y > self.h - BLOCK_SIZE or self.head.y < 0:
             print("Found a Wall")
             return True
-        if self.head in self.snake[1:-1]:
+        # Same as self.head in self.snake[1:-1]: drop the head's own piece and the tail's piece from the count
+        if self.occupancy[self.cell_index(self.head)] - 1 - (self.snake[-1] == self.head) > 0:
             print("Found Myself")
             return True
 
         return False
 
+    def cell_index(self, pt):
+        return int(pt.y // BLOCK_SIZE) * self.cols + int(pt.x // BLOCK_SIZE)
+
+    def _occupy(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            if self.occupancy[cell] == 0:
+                # Swap-remove the cell from the free list
+                last = self.free_cells.pop()
+                if last != cell:
+                    self.free_cells[self.free_pos[cell]] = last
+                    self.free_pos[last] = self.free_pos[cell]
+                self.free_pos[cell] = -1
+            self.occupancy[cell] += 1
+
+    def _vacate(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            self.occupancy[cell] -= 1
+            if self.occupancy[cell] == 0:
+                self.free_pos[cell] = len(self.free_cells)
+                self.free_cells.append(cell)
+
     def _update_ui(self):
         self.display.fill(BLACK)
 
@@ -98,9 +143,10 @@ class SnakeGame:
             pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
             pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
 
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        if self.food is not None:
+            pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
 
-        text = font.render("Score: " + str(self.score), True, WHITE)
+        text = self.font.render("Score: " + str(self.score), True, WHITE)
         self.display.blit(text, [0, 0])
         pygame.display.flip()
 
@@ -119,37 +165,237 @@ class SnakeGame:
         self.head = Point(int(x), int(y))
 
 
+def build_hamiltonian_cycle(cols, rows, method='serpentine', seed=None):
+    # Returns a flat successor array: successor[y * cols + x] is the cell index that comes after (x, y) on a cycle
+    # through every cell of the board. Both methods build it directly in O(cols * rows), there is no search.
+    # A cycle needs an even number of cells, so at least one side of the board has to be even.
+    if cols < 2 or rows < 2 or (cols * rows) % 2:
+        raise ValueError('A %dx%d board has no Hamiltonian cycle' % (cols, rows))
+    if method == 'tree':
+        return _tree_cycle(cols, rows, random.Random(seed))
+    if method != 'serpentine':
+        raise ValueError('Unknown method %r' % method)
+    if rows % 2:
+        # Zig-zag the columns instead by building the cycle on the transposed board and swapping x and y back
+        transposed = build_hamiltonian_cycle(rows, cols)
+        successor = [0] * (cols * rows)
+        for x in range(cols):
+            for y in range(rows):
+                nxt = transposed[x * rows + y]
+                successor[y * cols + x] = (nxt % rows) * cols + nxt // rows
+        return successor
+    # Rows zig-zag over columns 1..cols-1, right on even rows and left on odd rows, and column 0 is the lane back up
+    successor = [0] * (cols * rows)
+    for y in range(rows):
+        row = y * cols
+        for x in range(1, cols):
+            if y % 2 == 0:
+                successor[row + x] = row + x + 1 if x < cols - 1 else row + x + cols
+            else:
+                successor[row + x] = row + x - 1 if x > 1 else row + x + cols
+        successor[row] = row - cols if y > 0 else 1
+    # The last row runs left and turns into the return lane instead of going down
+    successor[(rows - 1) * cols + 1] = (rows - 1) * cols
+    return successor
+
+
+def _tree_cycle(cols, rows, rng):
+    # Splits the board into 2x2 blocks, joins them with a random spanning tree and walks around the tree. Every block
+    # on its own is the loop TL -> TR -> BR -> BL -> TL, and a tree edge between two blocks swaps two of their moves so
+    # the loops merge into one. Each cell is touched by at most one edge, so its move only depends on its own block.
+    if cols % 2 or rows % 2:
+        raise ValueError('The tree method needs an even number of rows and columns')
+    bw, bh = cols // 2, rows // 2
+    right = [False] * (bw * bh)
+    down = [False] * (bw * bh)
+    visited = [False] * (bw * bh)
+    visited[0] = True
+    stack = [0]
+    # Randomised depth first search without recursion
+    while stack:
+        b = stack[-1]
+        bx, by = b % bw, b // bw
+        options = [(nb, sideways) for nb, sideways, ok in ((b - 1, True, bx > 0), (b + 1, True, bx < bw - 1),
+                                                          (b - bw, False, by > 0), (b + bw, False, by < bh - 1))
+                   if ok and not visited[nb]]
+        if not options:
+            stack.pop()
+            continue
+        nb, sideways = rng.choice(options)
+        visited[nb] = True
+        if sideways:
+            right[min(b, nb)] = True
+        else:
+            down[min(b, nb)] = True
+        stack.append(nb)
+    successor = [0] * (cols * rows)
+    for by in range(bh):
+        for bx in range(bw):
+            b = by * bw + bx
+            tl = 2 * by * cols + 2 * bx
+            tr = tl + 1
+            bl = tl + cols
+            br = bl + 1
+            successor[tr] = tr + 1 if right[b] else br
+            successor[br] = br + cols if down[b] else bl
+            successor[bl] = bl - 1 if bx > 0 and right[b - 1] else tl
+            successor[tl] = tl - cols if by > 0 and down[b - bw] else tr
+    return successor
+
+
+def cycle_cells(successor):
+    # Flat cell indices in the order the cycle visits them, starting from the top left cell
+    cells = [0] * len(successor)
+    cell = 0
+    for n in range(len(successor)):
+        cells[n] = cell
+        cell = successor[cell]
+    return cells
+
+
+def cycle_order(successor, cols):
+    # Position of every cell along the cycle counting from the top left cell (1), indexed [y][x]
+    order = [[0] * cols for _ in range(len(successor) // cols)]
+    cell = 0
+    for count in range(1, len(successor) + 1):
+        order[cell // cols][cell % cols] = count
+        cell = successor[cell]
+    return order
+
+
+def orient_cycle(successor, head, neck):
+    # The snake starts out lying along a row, and on some boards the cycle runs from the head straight into the neck
+    # (whenever the head's row runs the other way). The cycle is then followed backwards, which puts the neck behind
+    # the head. head and neck are flat cell indices.
+    if successor[head] != neck:
+        return successor
+    predecessor = [0] * len(successor)
+    for cell, nxt in enumerate(successor):
+        predecessor[nxt] = cell
+    return predecessor
+
+
+def grid_neighbors(cols, rows):
+    # neighbors[cell] holds the flat indices of the cells next to cell (below, right, above, left) on the board
+    return [tuple(ny * cols + nx for nx, ny in ((x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y))
+                  if 0 <= nx < cols and 0 <= ny < rows)
+            for y in range(rows) for x in range(cols)]
+
+
+def room_needed(empty_squares, threshold):
+    # Smallest area for which area / empty_squares >= threshold. A full board needs no room at all.
+    if empty_squares <= 0:
+        return 0
+    need = int(empty_squares * threshold)
+    while need / empty_squares < threshold:
+        need += 1
+    return need
+
+
+def reachable_area(neighbors, blocked, start, target=-1, need=None):
+    # One breadth first pass over the free cells connected to start, for any planner that has a neighbour table and
+    # a blocked byte per cell (non zero where the snake cannot go). Returns (area, reached): how many free cells can
+    # be reached from start, start included, and whether target is start or next to one of them (a blocked target,
+    # like the tail, still counts). With need set the pass stops once the area is at least need and the target has
+    # been seen, because nothing it could still find would change either answer; area is then only a lower bound.
+    reached = start == target
+    if blocked[start]:
+        return 0, reached
+    visited = bytearray(blocked)
+    visited[start] = 1
+    queue = [start]
+    for cell in queue:
+        if need is not None and len(queue) >= need and (reached or target < 0):
+            break
+        for neighbor in neighbors[cell]:
+            if neighbor == target:
+                reached = True
+            if not visited[neighbor]:
+                visited[neighbor] = 1
+                queue.append(neighbor)
+    return len(queue), reached
+
+
+class VirtualSnake:
+    # The body the snake will have after following path (a list of Points starting at its head), as a view instead of
+    # a copy: the newest pieces are the path cells, newest first, and the rest is the real body minus the pieces the
+    # tail moved off. With grow=True the last move eats, so like SnakeGame.play_step the tail piece is doubled.
+    # Indexing, len() and iteration work like they do on the real deque.
+    def __init__(self, snake, path, grow=True):
+        self.snake = snake
+        self.front = path[:0:-1]
+        self.grow = grow
+        self.length = len(snake) + grow
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        if self.grow and i == self.length - 1:
+            i -= 1
+        if i < len(self.front):
+            return self.front[i]
+        return self.snake[i - len(self.front)]
+
+    def __iter__(self):
+        body_length = self.length - self.grow
+        yield from self.front[:body_length]
+        yield from itertools.islice(self.snake, max(0, body_length - len(self.front)))
+        if self.grow:
+            yield self[-1]
+
+
 class ImprovedAI:
-    def __init__(self, game):
+    def __init__(self, game, reuse_path=True, virtual_snake=True):
         self.game = game
-        self.hamiltonian_cycle = self.generate_hamiltonian_cycle()
-
-    def generate_hamiltonian_cycle(self):
-        width = self.game.w // BLOCK_SIZE
-        height = self.game.h // BLOCK_SIZE
-        cycle = [[0] * width for _ in range(height)]
-
-        def dfs(x, y, count):
-            if count == width * height:
-                return True
-            for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < width and 0 <= ny < height and cycle[ny][nx] == 0:
-                    cycle[ny][nx] = count + 1
-                    if dfs(nx, ny, count + 1):
-                        return True
-                    cycle[ny][nx] = 0
-            return False
-
-        cycle[0][0] = 1
-        dfs(0, 0, 1)
-        return cycle
+        self.successor = orient_cycle(self.generate_hamiltonian_cycle(), game.cell_index(game.snake[0]),
+                                      game.cell_index(game.snake[1]))
+        self.hamiltonian_cycle = cycle_order(self.successor, self.game.cols)
+        # Lookup tables built once with the cycle so a move never has to search the grid:
+        # cycle_cells[n] is the flat cell index of the (n + 1)th cell on the cycle and next_point[cell] is the
+        # top left pixel of the cell that follows cell
+        self.cycle_cells = cycle_cells(self.successor)
+        self.next_point = [Point((nxt % self.game.cols) * BLOCK_SIZE, (nxt // self.game.cols) * BLOCK_SIZE)
+                           for nxt in self.successor]
+        # A* works on flat cell indices. The per cell scores below are allocated once and reused by every search;
+        # an entry only counts if its generation stamp matches the current search, so nothing is cleared per move.
+        cols, rows = self.game.cols, self.game.rows
+        self.neighbors = grid_neighbors(cols, rows)
+        self.g_score = [0] * (cols * rows)
+        self.came_from = [0] * (cols * rows)
+        self.seen = [0] * (cols * rows)
+        self.closed = [0] * (cols * rows)
+        self.generation = 0
+        # With reuse_path the rest of the last path to the food is used again when it is still free, instead of
+        # searching from scratch after every one cell move
+        self.reuse_path = reuse_path
+        self.last_path = None
+        self.last_goal = None
+        # Whether the tail can be reached from the goal of the last path a_star returned. It comes out of the same
+        # pass as the room check so get_next_move does not need a second flood fill.
+        self.goal_reaches_tail = False
+        # With virtual_snake those checks look at where the body will be once the snake has eaten at the end of the
+        # path, not at where it is now
+        self.virtual_snake = virtual_snake
+
+    def generate_hamiltonian_cycle(self, method='serpentine', seed=None):
+        # Flat successor array of the cycle, see build_hamiltonian_cycle
+        return build_hamiltonian_cycle(self.game.cols, self.game.rows, method, seed)
 
     def is_safe_move(self, next_head, snake):
         if next_head.x < 0 or next_head.x >= self.game.w or \
                 next_head.y < 0 or next_head.y >= self.game.h:
             return False
-        if next_head in snake[:-1]:
+        if snake is self.game.snake:
+            # Same as next_head in snake[:-1] without the scan, the tail's piece does not count
+            if self.game.occupancy[self.game.cell_index(next_head)] - (snake[-1] == next_head) > 0:
+                return False
+            return True
+        if next_head in list(snake)[:-1]:
             return False
         return True
 
@@ -161,7 +407,7 @@ class ImprovedAI:
 
         if snake_length < total_squares * 0.3:
             path = self.a_star(head, food, self.game.snake)
-            if path and self.can_reach_tail(path[-1], self.game.snake):
+            if path and self.goal_reaches_tail:
                 print("Using A*")
                 return self.get_direction(head, path[1])
 
@@ -169,102 +415,134 @@ class ImprovedAI:
         return self.follow_hamiltonian_cycle()
 
     def a_star(self, start, goal, snake):
-        def heuristic(a, b, snake_length):
-            manhattan_distance = abs(a.x - b.x) + abs(a.y - b.y)
-            return manhattan_distance + (snake_length // 10)
-
-        def get_neighbors(point, snake):
-            neighbors = []
-            for dx, dy in [(0, BLOCK_SIZE), (BLOCK_SIZE, 0), (0, -BLOCK_SIZE), (-BLOCK_SIZE, 0)]:
-                new_point = Point(point.x + dx, point.y + dy)
-                if self.is_safe_move(new_point, snake):
-                    neighbors.append(new_point)
-            return neighbors
-
-        def can_reach_percentage(position, snake, threshold=0.8):
-            total_squares = (self.game.w // BLOCK_SIZE) * (self.game.h // BLOCK_SIZE)
-            empty_squares = total_squares - len(snake)
-            reachable_squares = self.count_reachable_squares(position, snake)
-            return reachable_squares / empty_squares >= threshold
-
-        open_set = []
-        heapq.heappush(open_set, (0, start))
-        came_from = {}
-        g_score = {start: 0}
-        f_score = {start: heuristic(start, goal, len(snake))}
+        cols, rows = self.game.cols, self.game.rows
+        size = cols * rows
+        blocked = self.blocked_cells(snake)
+        start_cell = self.game.cell_index(start)
+        goal_cell = self.game.cell_index(goal)
+
+        def finish(path):
+            # The path is only taken if at least 80% of the empty squares can still be reached from the goal. A* never
+            # revisits a cell it has finished, so when the path it found fails there is no other one to try.
+            self.last_path = path
+            self.last_goal = goal_cell
+            points = [Point((cell % cols) * BLOCK_SIZE, (cell // cols) * BLOCK_SIZE) for cell in path]
+            if self.virtual_snake and snake is self.game.snake:
+                future = VirtualSnake(snake, points)
+                after = self.blocked_cells(future)
+                # The head is on the goal now, the search starts from it and it counts towards the area
+                after[goal_cell] = 0
+                need = room_needed(size - len(future), 0.8) + 1
+                area, self.goal_reaches_tail = reachable_area(self.neighbors, after, goal_cell,
+                                                              self.game.cell_index(future[-1]), need)
+            else:
+                need = room_needed(size - len(snake), 0.8)
+                area, self.goal_reaches_tail = reachable_area(self.neighbors, blocked, goal_cell,
+                                                              self.game.cell_index(snake[-1]), need)
+            if area < need:
+                return None
+            return points
+
+        # The head moved one cell along the last path: keep following it while none of its cells got blocked
+        last = self.last_path
+        if self.reuse_path and snake is self.game.snake and last and len(last) > 2 and \
+                last[1] == start_cell and self.last_goal == goal_cell and not any(blocked[cell] for cell in last[2:]):
+            return finish(last[1:])
+
+        self.generation += 1
+        generation = self.generation
+        g_score, came_from, seen, closed = self.g_score, self.came_from, self.seen, self.closed
+        goal_x, goal_y = goal_cell % cols, goal_cell // cols
+        penalty = len(snake) // 10
+
+        # Heap entries are plain ints, f * size + x * rows + y, so they pop in the same (f, Point) order as before
+        start_x, start_y = start_cell % cols, start_cell // cols
+        g_score[start_cell] = 0
+        seen[start_cell] = generation
+        h = (abs(start_x - goal_x) + abs(start_y - goal_y)) * BLOCK_SIZE + penalty
+        open_set = [h * size + start_x * rows + start_y]
 
         while open_set:
-            current = heapq.heappop(open_set)[1]
-
-            if current == goal:
-                path = []
-                while current in came_from:
-                    path.append(current)
+            f, order = divmod(heapq.heappop(open_set), size)
+            x, y = divmod(order, rows)
+            current = y * cols + x
+            # A cell can be in the heap more than once, only its best entry is expanded
+            if closed[current] == generation:
+                continue
+            closed[current] = generation
+
+            if current == goal_cell:
+                path = [current]
+                while current != start_cell:
                     current = came_from[current]
-                path.append(start)
-                path = path[::-1]
-
-                # Check if the path allows the snake to reach at least 80% of empty squares
-                if can_reach_percentage(path[-1], snake):
-                    return path
-                else:
-                    continue  # Discard this path and continue searching
-
-            for neighbor in get_neighbors(current, snake):
-                tentative_g_score = g_score[current] + BLOCK_SIZE
-
-                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
+                    path.append(current)
+                return finish(path[::-1])
+
+            tentative_g_score = g_score[current] + BLOCK_SIZE
+            for neighbor in self.neighbors[current]:
+                if blocked[neighbor]:
+                    continue
+                if seen[neighbor] != generation or tentative_g_score < g_score[neighbor]:
+                    seen[neighbor] = generation
                     came_from[neighbor] = current
                     g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = g_score[neighbor] + heuristic(neighbor, goal, len(snake))
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
+                    nx, ny = neighbor % cols, neighbor // cols
+                    f = tentative_g_score + (abs(nx - goal_x) + abs(ny - goal_y)) * BLOCK_SIZE + penalty
+                    heapq.heappush(open_set, f * size + nx * rows + ny)
 
         return None
 
-    def count_reachable_squares(self, position, snake):
-        visited = set()
-        stack = [position]
-        count = 0
-
-        while stack:
-            current = stack.pop()
-            if current not in visited and self.is_safe_move(current, snake):
-                visited.add(current)
-                count += 1
-                for dx, dy in [(0, BLOCK_SIZE), (BLOCK_SIZE, 0), (0, -BLOCK_SIZE), (-BLOCK_SIZE, 0)]:
-                    stack.append(Point(current.x + dx, current.y + dy))
+    def blocked_cells(self, snake):
+        # One byte per cell, non zero where is_safe_move(cell, snake) would say no
+        if isinstance(snake, VirtualSnake) and snake.snake is self.game.snake:
+            # Starts from the real counts and only touches the cells that change: the pieces the tail moved off, the
+            # path cells the head moved onto and the doubled tail, so it costs O(path) on top of the copy
+            cell_index = self.game.cell_index
+            blocked = bytearray(self.game.occupancy)
+            for pt in itertools.islice(reversed(snake.snake), len(snake.front)):
+                blocked[cell_index(pt)] -= 1
+            for pt in snake.front[:len(snake) - snake.grow]:
+                blocked[cell_index(pt)] += 1
+            if snake.grow:
+                blocked[cell_index(snake[-1])] += 1
+            blocked[cell_index(snake[-1])] -= 1
+            return blocked
+        if snake is self.game.snake:
+            # The tail's piece does not count, it moves out of the way
+            blocked = bytearray(self.game.occupancy)
+            blocked[self.game.cell_index(snake[-1])] -= 1
+            return blocked
+        blocked = bytearray(self.game.cols * self.game.rows)
+        for pt in list(snake)[:-1]:
+            if 0 <= pt.x < self.game.w and 0 <= pt.y < self.game.h:
+                blocked[self.game.cell_index(pt)] = 1
+        return blocked
+
+    def reachability(self, position, snake, threshold=None):
+        # (area, tail reachable) from position in one pass, see reachable_area. threshold is a fraction of the empty
+        # squares; once that much room and the tail are found the pass stops early.
+        if not (0 <= position.x < self.game.w and 0 <= position.y < self.game.h):
+            return 0, position == snake[-1]
+        need = None
+        if threshold is not None:
+            need = room_needed(self.game.cols * self.game.rows - len(snake), threshold)
+        return reachable_area(self.neighbors, self.blocked_cells(snake), self.game.cell_index(position),
+                              self.game.cell_index(snake[-1]), need)
 
-        return count
+    def count_reachable_squares(self, position, snake):
+        return self.reachability(position, snake)[0]
 
     def can_reach_tail(self, position, snake):
-        visited = set()
-        stack = [position]
-        tail = snake[-1]
-
-        while stack:
-            current = stack.pop()
-            if current == tail:
-                return True
-            if current not in visited and self.is_safe_move(current, snake):
-                visited.add(current)
-                for dx, dy in [(0, BLOCK_SIZE), (BLOCK_SIZE, 0), (0, -BLOCK_SIZE), (-BLOCK_SIZE, 0)]:
-                    stack.append(Point(current.x + dx, current.y + dy))
-        return False
+        return self.reachability(position, snake)[1]
 
     def follow_hamiltonian_cycle(self):
         head = self.game.snake[0]
         x = max(0, min(int(head.x // BLOCK_SIZE), (self.game.w // BLOCK_SIZE) - 1))
         y = max(0, min(int(head.y // BLOCK_SIZE), (self.game.h // BLOCK_SIZE) - 1))
-        current_index = self.hamiltonian_cycle[y][x]
-        next_index = (current_index % (self.game.w * self.game.h // BLOCK_SIZE ** 2)) + 1
-
-        # Always find the next point in the Hamiltonian cycle
-        for dy in range(self.game.h // BLOCK_SIZE):
-            for dx in range(self.game.w // BLOCK_SIZE):
-                if self.hamiltonian_cycle[dy][dx] == next_index:
-                    next_point = Point(dx * BLOCK_SIZE, dy * BLOCK_SIZE)
-                    if self.is_safe_move(next_point, self.game.snake):
-                        return self.get_direction(head, next_point)
+        # Always try the next point in the Hamiltonian cycle first
+        next_point = self.next_point[y * self.game.cols + x]
+        if self.is_safe_move(next_point, self.game.snake):
+            return self.get_direction(head, next_point)
 
         # If the next point in the cycle is not safe, look for any safe adjacent move
         for direction in [Direction.RIGHT, Direction.LEFT, Direction.UP, Direction.DOWN]:
@@ -276,6 +554,10 @@ class ImprovedAI:
         print("ERROR: No safe move found. This should not happen.")
         return self.game.direction
 
+    def next_cell(self, point):
+        # The point after point on the cycle, in O(1)
+        return self.next_point[int(point.y // BLOCK_SIZE) * self.game.cols + int(point.x // BLOCK_SIZE)]
+
     def get_next_point(self, head, direction):
         if direction == Direction.RIGHT:
             return Point(head.x + BLOCK_SIZE, head.y)
@@ -299,7 +581,7 @@ class ImprovedAI:
     def chase_tail(self):
         head = self.game.snake[0]
         tail = self.game.snake[-1]
-        path = self.a_star(head, tail, self.game.snake[:-1])
+        path = self.a_star(head, tail, list(self.game.snake)[:-1])
         if path:
             return self.get_direction(head, path[1])
         return self.follow_hamiltonian_cycle()
@@ -1,10 +1,8 @@
 import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
 
 class Direction(Enum):
     RIGHT = 1
@@ -26,43 +24,61 @@ SPEED = 20
 
 class SnakeGame:
 
-    def __init__(self, w=640, h=480):
+    def __init__(self, w=640, h=480, seed=None, render=True):
         self.w = w
         self.h = h
-        self.display = pygame.display.set_mode((self.w, self.h))
-        pygame.display.set_caption('Snake')
-        self.clock = pygame.time.Clock()
+        self.rng = random.Random(seed)
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        # render=False plays without a window, events or frame rate limit, for batch runs like tournament.py
+        self.render = render
+        if self.render:
+            pygame.init()
+            self.font = pygame.font.Font('arial.ttf', 25)
+            self.display = pygame.display.set_mode((self.w, self.h))
+            pygame.display.set_caption('Snake')
+            self.clock = pygame.time.Clock()
         self.direction = Direction.RIGHT
         self.head = Point(self.w / 2, self.h / 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        # Number of snake pieces on each cell, kept in sync with self.snake
+        self.occupancy = bytearray(self.cols * self.rows)
+        # Unoccupied cells in any order plus each cell's position in that list (-1 if occupied)
+        self.free_cells = list(range(self.cols * self.rows))
+        self.free_pos = list(range(self.cols * self.rows))
+        for pt in self.snake:
+            self._occupy(pt)
         self.score = 0
         self.food = None
         self._place_food()
         self.speed_multiplier = 1
 
     def _place_food(self):
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        # Board is full, nothing left to eat
+        if not self.free_cells:
+            self.food = None
+            return
+        cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
 
     def play_step(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q:
-                    self.speed_multiplier = min(10, self.speed_multiplier * 10)
-                elif event.key == pygame.K_a:
-                    self.speed_multiplier = max(0.1, self.speed_multiplier / 10)
-
-        self.snake.pop()
+        if self.render:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_q:
+                        self.speed_multiplier = min(10, self.speed_multiplier * 10)
+                    elif event.key == pygame.K_a:
+                        self.speed_multiplier = max(0.1, self.speed_multiplier / 10)
+
+        self._vacate(self.snake.pop())
         self._move(self.direction)
-        self.snake.insert(0, self.head)
+        self.snake.appendleft(self.head)
+        self._occupy(self.head)
 
         game_over = False
         if self._is_collision():
@@ -73,19 +89,49 @@ class SnakeGame:
             self.score += 1
             self._place_food()
             self.snake.append(Point(self.snake[-1].x, self.snake[-1].y))
-
-        self._update_ui()
-        self.clock.tick(SPEED * self.speed_multiplier)
+            self._occupy(self.snake[-1])
+            # The snake fills the whole board, nothing is left to play for
+            if self.food is None:
+                game_over = True
+                return game_over, self.score
+
+        if self.render:
+            self._update_ui()
+            self.clock.tick(SPEED * self.speed_multiplier)
         return game_over, self.score
 
     def _is_collision(self):
         if self.head.x > self.w - BLOCK_SIZE or self.head.x < 0 or \
                 self.head.y > self.h - BLOCK_SIZE or self.head.y < 0:
             return True
-        if self.head in self.snake[1:]:
+        # Same as self.head in self.snake[1:], the head itself is one of the pieces on its cell
+        if self.occupancy[self.cell_index(self.head)] > 1:
             return True
         return False
 
+    def cell_index(self, pt):
+        return int(pt.y // BLOCK_SIZE) * self.cols + int(pt.x // BLOCK_SIZE)
+
+    def _occupy(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            if self.occupancy[cell] == 0:
+                # Swap-remove the cell from the free list
+                last = self.free_cells.pop()
+                if last != cell:
+                    self.free_cells[self.free_pos[cell]] = last
+                    self.free_pos[last] = self.free_pos[cell]
+                self.free_pos[cell] = -1
+            self.occupancy[cell] += 1
+
+    def _vacate(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            self.occupancy[cell] -= 1
+            if self.occupancy[cell] == 0:
+                self.free_pos[cell] = len(self.free_cells)
+                self.free_cells.append(cell)
+
     def _update_ui(self):
         self.display.fill(BLACK)
 
@@ -93,9 +139,10 @@ class SnakeGame:
             pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
             pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
 
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        if self.food is not None:
+            pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
 
-        text = font.render("Score: " + str(self.score), True, WHITE)
+        text = self.font.render("Score: " + str(self.score), True, WHITE)
         self.display.blit(text, [0, 0])
         pygame.display.flip()
 
@@ -113,47 +160,140 @@ class SnakeGame:
 
         self.head = Point(x, y)
 
+def build_hamiltonian_cycle(cols, rows, method='serpentine', seed=None):
+    # Returns a flat successor array: successor[y * cols + x] is the cell index that comes after (x, y) on a cycle
+    # through every cell of the board. Both methods build it directly in O(cols * rows), there is no search.
+    # A cycle needs an even number of cells, so at least one side of the board has to be even.
+    if cols < 2 or rows < 2 or (cols * rows) % 2:
+        raise ValueError('A %dx%d board has no Hamiltonian cycle' % (cols, rows))
+    if method == 'tree':
+        return _tree_cycle(cols, rows, random.Random(seed))
+    if method != 'serpentine':
+        raise ValueError('Unknown method %r' % method)
+    if rows % 2:
+        # Zig-zag the columns instead by building the cycle on the transposed board and swapping x and y back
+        transposed = build_hamiltonian_cycle(rows, cols)
+        successor = [0] * (cols * rows)
+        for x in range(cols):
+            for y in range(rows):
+                nxt = transposed[x * rows + y]
+                successor[y * cols + x] = (nxt % rows) * cols + nxt // rows
+        return successor
+    # Rows zig-zag over columns 1..cols-1, right on even rows and left on odd rows, and column 0 is the lane back up
+    successor = [0] * (cols * rows)
+    for y in range(rows):
+        row = y * cols
+        for x in range(1, cols):
+            if y % 2 == 0:
+                successor[row + x] = row + x + 1 if x < cols - 1 else row + x + cols
+            else:
+                successor[row + x] = row + x - 1 if x > 1 else row + x + cols
+        successor[row] = row - cols if y > 0 else 1
+    # The last row runs left and turns into the return lane instead of going down
+    successor[(rows - 1) * cols + 1] = (rows - 1) * cols
+    return successor
+
+
+def _tree_cycle(cols, rows, rng):
+    # Splits the board into 2x2 blocks, joins them with a random spanning tree and walks around the tree. Every block
+    # on its own is the loop TL -> TR -> BR -> BL -> TL, and a tree edge between two blocks swaps two of their moves so
+    # the loops merge into one. Each cell is touched by at most one edge, so its move only depends on its own block.
+    if cols % 2 or rows % 2:
+        raise ValueError('The tree method needs an even number of rows and columns')
+    bw, bh = cols // 2, rows // 2
+    right = [False] * (bw * bh)
+    down = [False] * (bw * bh)
+    visited = [False] * (bw * bh)
+    visited[0] = True
+    stack = [0]
+    # Randomised depth first search without recursion
+    while stack:
+        b = stack[-1]
+        bx, by = b % bw, b // bw
+        options = [(nb, sideways) for nb, sideways, ok in ((b - 1, True, bx > 0), (b + 1, True, bx < bw - 1),
+                                                          (b - bw, False, by > 0), (b + bw, False, by < bh - 1))
+                   if ok and not visited[nb]]
+        if not options:
+            stack.pop()
+            continue
+        nb, sideways = rng.choice(options)
+        visited[nb] = True
+        if sideways:
+            right[min(b, nb)] = True
+        else:
+            down[min(b, nb)] = True
+        stack.append(nb)
+    successor = [0] * (cols * rows)
+    for by in range(bh):
+        for bx in range(bw):
+            b = by * bw + bx
+            tl = 2 * by * cols + 2 * bx
+            tr = tl + 1
+            bl = tl + cols
+            br = bl + 1
+            successor[tr] = tr + 1 if right[b] else br
+            successor[br] = br + cols if down[b] else bl
+            successor[bl] = bl - 1 if bx > 0 and right[b - 1] else tl
+            successor[tl] = tl - cols if by > 0 and down[b - bw] else tr
+    return successor
+
+
+def cycle_cells(successor):
+    # Flat cell indices in the order the cycle visits them, starting from the top left cell
+    cells = [0] * len(successor)
+    cell = 0
+    for n in range(len(successor)):
+        cells[n] = cell
+        cell = successor[cell]
+    return cells
+
+
+def cycle_order(successor, cols):
+    # Position of every cell along the cycle counting from the top left cell (1), indexed [y][x]
+    order = [[0] * cols for _ in range(len(successor) // cols)]
+    cell = 0
+    for count in range(1, len(successor) + 1):
+        order[cell // cols][cell % cols] = count
+        cell = successor[cell]
+    return order
+
+
+def orient_cycle(successor, head, neck):
+    # The snake starts out lying along a row, and on some boards the cycle runs from the head straight into the neck
+    # (whenever the head's row runs the other way). The cycle is then followed backwards, which puts the neck behind
+    # the head. head and neck are flat cell indices.
+    if successor[head] != neck:
+        return successor
+    predecessor = [0] * len(successor)
+    for cell, nxt in enumerate(successor):
+        predecessor[nxt] = cell
+    return predecessor
+
+
 class SafeHamiltonianAI:
     def __init__(self, game):
         self.game = game
-        self.hamiltonian_cycle = self.generate_hamiltonian_cycle()
-
-    def generate_hamiltonian_cycle(self):
-        width = self.game.w // BLOCK_SIZE
-        height = self.game.h // BLOCK_SIZE
-        cycle = [[0] * width for _ in range(height)]
-
-        def dfs(x, y, count):
-            if count == width * height:
-                return True
-            for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < width and 0 <= ny < height and cycle[ny][nx] == 0:
-                    cycle[ny][nx] = count + 1
-                    if dfs(nx, ny, count + 1):
-                        return True
-                    cycle[ny][nx] = 0
-            return False
-
-        cycle[0][0] = 1
-        dfs(0, 0, 1)
-        return cycle
+        self.successor = orient_cycle(self.generate_hamiltonian_cycle(), game.cell_index(game.snake[0]),
+                                      game.cell_index(game.snake[1]))
+        self.hamiltonian_cycle = cycle_order(self.successor, self.game.cols)
+        # Lookup tables built once with the cycle so a move never has to search the grid:
+        # cycle_cells[n] is the flat cell index of the (n + 1)th cell on the cycle and next_point[cell] is the
+        # top left pixel of the cell that follows cell
+        self.cycle_cells = cycle_cells(self.successor)
+        self.next_point = [Point((nxt % self.game.cols) * BLOCK_SIZE, (nxt // self.game.cols) * BLOCK_SIZE)
+                           for nxt in self.successor]
+
+    def generate_hamiltonian_cycle(self, method='serpentine', seed=None):
+        # Flat successor array of the cycle, see build_hamiltonian_cycle
+        return build_hamiltonian_cycle(self.game.cols, self.game.rows, method, seed)
 
     def get_next_move(self):
         head = self.game.snake[0]
-        x = int(head.x // BLOCK_SIZE)
-        y = int(head.y // BLOCK_SIZE)
-        current_index = self.hamiltonian_cycle[y][x]
-        next_index = (current_index % (self.game.w * self.game.h // BLOCK_SIZE ** 2)) + 1
-
-        for dy in range(self.game.h // BLOCK_SIZE):
-            for dx in range(self.game.w // BLOCK_SIZE):
-                if self.hamiltonian_cycle[dy][dx] == next_index:
-                    next_point = Point(dx * BLOCK_SIZE, dy * BLOCK_SIZE)
-                    return self.get_direction(head, next_point)
-
-        print("ERROR: No valid move found. This should not happen.")
-        return self.game.direction
+        return self.get_direction(head, self.next_cell(head))
+
+    def next_cell(self, point):
+        # The point after point on the cycle, in O(1)
+        return self.next_point[int(point.y // BLOCK_SIZE) * self.game.cols + int(point.x // BLOCK_SIZE)]
 
     def get_direction(self, from_point, to_point):
         if to_point.x > from_point.x:
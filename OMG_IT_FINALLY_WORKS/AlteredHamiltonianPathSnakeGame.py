@@ -1,12 +1,9 @@
 import pygame
 import random
 from enum import Enum
-from collections import namedtuple
-
-
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
-
+from collections import namedtuple, deque
+from array import array
+import numpy as np
 
 class Direction(Enum):
     RIGHT = 1
@@ -27,44 +24,70 @@ BLACK = (0, 0, 0)
 BLOCK_SIZE = 20
 SPEED = 20
 
-ARENA_WIDTH = 32
-ARENA_HEIGHT = 24
-ARENA_SIZE = ARENA_WIDTH * ARENA_HEIGHT
-
 
 class SnakeGame:
-    def __init__(self, w=640, h=480):
+    def __init__(self, w=640, h=480, seed=None, render=True):
         self.w = w
         self.h = h
-        self.display = pygame.display.set_mode((self.w, self.h))
-        pygame.display.set_caption('Snake AI')
-        self.clock = pygame.time.Clock()
+        self.rng = random.Random(seed)
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        # render=False plays without a window, events or frame rate limit, for batch runs like tournament.py
+        self.render = render
+        if self.render:
+            pygame.init()
+            self.font = pygame.font.Font('arial.ttf', 25)
+            self.display = pygame.display.set_mode((self.w, self.h))
+            pygame.display.set_caption('Snake AI')
+            self.clock = pygame.time.Clock()
 
         self.direction = Direction.RIGHT
         self.head = Point(self.w // 2, self.h // 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        # Number of snake pieces on each cell, kept in sync with self.snake
+        self.occupancy = bytearray(self.cols * self.rows)
+        # Unoccupied cells in any order plus each cell's position in that list (-1 if occupied)
+        self.free_cells = list(range(self.cols * self.rows))
+        self.free_pos = list(range(self.cols * self.rows))
+        for pt in self.snake:
+            self._occupy(pt)
 
         self.score = 0
         self.food = None
         self._place_food()
 
-        self.maze = Maze()
+        # The maze covers the whole board, one tour cell per grid cell. It is drawn from the game's generator so a
+        # seed fixes the maze as well as the food.
+        self.maze = Maze(self.cols, self.rows, self.rng)
         self.maze.generate()
 
+        # Flat tables for the planner, all indexed by cell (y * cols + x) or tour number, so a move is a handful of
+        # list lookups: tour_number[cell] is the cell's place on the tour, tour_cells[number] the cell at that place,
+        # and moves[cell] the (direction, cell) pairs that stay on the board, in the order the planner tries them
+        self.tour_number = array('i', self.maze.tour_to_number.ravel().tobytes())
+        self.tour_cells = array('i', np.argsort(self.maze.tour_to_number.ravel()).astype(np.int32).tobytes())
+        self.moves = [tuple((direction, ny * self.cols + nx) for direction, nx, ny in
+                            ((Direction.RIGHT, x + 1, y), (Direction.LEFT, x - 1, y),
+                             (Direction.DOWN, x, y + 1), (Direction.UP, x, y - 1))
+                            if 0 <= nx < self.cols and 0 <= ny < self.rows)
+                      for y in range(self.rows) for x in range(self.cols)]
+
     def _place_food(self):
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        # Board is full, nothing left to eat
+        if not self.free_cells:
+            self.food = None
+            return
+        cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
 
     def play_step(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+        if self.render:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
 
         # Move
         self._move(self._ai_get_new_direction())
@@ -79,12 +102,17 @@ class SnakeGame:
         if self.head == self.food:
             self.score += 1
             self._place_food()
+            # The snake fills the whole board, nothing is left to play for
+            if self.food is None:
+                game_over = True
+                return game_over, self.score
         else:
-            self.snake.pop()
+            self._vacate(self.snake.pop())
 
-        # Update UI and clock
-        self._update_ui()
-        self.clock.tick(SPEED)
+        if self.render:
+            # Update UI and clock
+            self._update_ui()
+            self.clock.tick(SPEED)
 
         return game_over, self.score
 
@@ -92,10 +120,34 @@ class SnakeGame:
         if (self.head.x > self.w - BLOCK_SIZE or self.head.x < 0 or
                 self.head.y > self.h - BLOCK_SIZE or self.head.y < 0):
             return True
-        if self.head in self.snake[1:]:
+        # Same as self.head in self.snake[1:], the head itself is one of the pieces on its cell
+        if self.occupancy[self.cell_index(self.head)] > 1:
             return True
         return False
 
+    def cell_index(self, pt):
+        return int(pt.y // BLOCK_SIZE) * self.cols + int(pt.x // BLOCK_SIZE)
+
+    def _occupy(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            if self.occupancy[cell] == 0:
+                # Swap-remove the cell from the free list
+                last = self.free_cells.pop()
+                if last != cell:
+                    self.free_cells[self.free_pos[cell]] = last
+                    self.free_pos[last] = self.free_pos[cell]
+                self.free_pos[cell] = -1
+            self.occupancy[cell] += 1
+
+    def _vacate(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            self.occupancy[cell] -= 1
+            if self.occupancy[cell] == 0:
+                self.free_pos[cell] = len(self.free_cells)
+                self.free_cells.append(cell)
+
     def _update_ui(self):
         self.display.fill(BLACK)
 
@@ -103,9 +155,10 @@ class SnakeGame:
             pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
             pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
 
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        if self.food is not None:
+            pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
 
-        text = font.render("Score: " + str(self.score), True, WHITE)
+        text = self.font.render("Score: " + str(self.score), True, WHITE)
         self.display.blit(text, [0, 0])
         pygame.display.flip()
 
@@ -121,22 +174,22 @@ class SnakeGame:
         elif direction == Direction.UP:
             y -= BLOCK_SIZE
         self.head = Point(x, y)
-        self.snake.insert(0, self.head)
+        self.snake.appendleft(self.head)
+        self._occupy(self.head)
 
     def _ai_get_new_direction(self):
-        x = self.head.x // BLOCK_SIZE
-        y = self.head.y // BLOCK_SIZE
-        path_number = self.maze.get_path_number(x, y)
-        distance_to_food = self.maze.path_distance(path_number, self.maze.get_path_number(self.food.x // BLOCK_SIZE,
-                                                                                          self.food.y // BLOCK_SIZE))
-        distance_to_tail = self.maze.path_distance(path_number,
-                                                   self.maze.get_path_number(self.snake[-1].x // BLOCK_SIZE,
-                                                                             self.snake[-1].y // BLOCK_SIZE))
+        size = self.maze.size
+        tour_number = self.tour_number
+        head_cell = self.cell_index(self.head)
+        path_number = tour_number[head_cell]
+        # Same as maze.path_distance: how many steps along the tour from the head to the cell, minus one
+        distance_to_food = (tour_number[self.cell_index(self.food)] - path_number - 1) % size
+        distance_to_tail = (tour_number[self.cell_index(self.snake[-1])] - path_number - 1) % size
 
         cutting_amount_available = distance_to_tail - len(self.snake) - 3
-        num_empty_squares = ARENA_SIZE - len(self.snake) - 1
+        num_empty_squares = size - len(self.snake) - 1
 
-        if num_empty_squares < ARENA_SIZE // 2:
+        if num_empty_squares < size // 2:
             cutting_amount_available = 0
         elif distance_to_food < distance_to_tail:
             cutting_amount_available -= 1
@@ -147,183 +200,119 @@ class SnakeGame:
         cutting_amount_available = min(cutting_amount_available, cutting_amount_desired)
         cutting_amount_available = max(cutting_amount_available, 0)
 
-        directions = [Direction.RIGHT, Direction.LEFT, Direction.DOWN, Direction.UP]
-        best_dir = None
+        # Takes the free neighbour that skips furthest ahead on the tour without skipping more than is available
+        best_dir = Direction.RIGHT
         best_dist = -1
-
-        for dir in directions:
-            new_x, new_y = x, y
-            if dir == Direction.RIGHT:
-                new_x += 1
-            elif dir == Direction.LEFT:
-                new_x -= 1
-            elif dir == Direction.DOWN:
-                new_y += 1
-            elif dir == Direction.UP:
-                new_y -= 1
-
-            if self._is_valid_move(new_x, new_y):
-                dist = self.maze.path_distance(path_number, self.maze.get_path_number(new_x, new_y))
-                if dist <= cutting_amount_available and dist > best_dist:
-                    best_dir = dir
+        occupancy = self.occupancy
+        for direction, cell in self.moves[head_cell]:
+            if not occupancy[cell]:
+                dist = (tour_number[cell] - path_number - 1) % size
+                if best_dist < dist <= cutting_amount_available:
+                    best_dir = direction
                     best_dist = dist
 
-        return best_dir if best_dir else Direction.RIGHT
+        return best_dir
+
 
-    def _is_valid_move(self, x, y):
-        if x < 0 or y < 0 or x >= ARENA_WIDTH or y >= ARENA_HEIGHT:
-            return False
-        return Point(x * BLOCK_SIZE, y * BLOCK_SIZE) not in self.snake
+# Bits of Maze.edges
+CAN_GO_RIGHT = 1
+CAN_GO_DOWN = 2
 
 
 class Maze:
-    def __init__(self):
-        self.nodes = [[{'visited': False, 'can_go_right': False, 'can_go_down': False} for _ in range(ARENA_WIDTH // 2)]
-                      for _ in range(ARENA_HEIGHT // 2)]
-        self.tour_to_number = [[0 for _ in range(ARENA_WIDTH)] for _ in range(ARENA_HEIGHT)]
+    # The maze is a random spanning tree over the (width // 2) x (height // 2) grid of 2x2 blocks, and the tour is the
+    # walk around that tree, which passes through every cell of the width x height board exactly once. Both are kept
+    # in NumPy arrays: edges holds a CAN_GO_RIGHT / CAN_GO_DOWN bit field per block and tour_to_number holds the
+    # position of every cell on the tour. rng is the random.Random the tree is shuffled with (the global random module
+    # if None).
+    def __init__(self, width, height, rng=None):
+        if width % 2 or height % 2:
+            raise ValueError('The maze needs an even width and height, got %dx%d' % (width, height))
+        self.rng = rng if rng is not None else random
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.edges = np.zeros((height // 2, width // 2), dtype=np.uint8)
+        self.tour_to_number = np.zeros((height, width), dtype=np.int32)
 
     def generate(self):
-        self._generate_r(-1, -1, 0, 0)
+        self._generate_tree()
         self._generate_tour_number()
 
-    def _generate_r(self, from_x, from_y, x, y):
-        if x < 0 or y < 0 or x >= ARENA_WIDTH // 2 or y >= ARENA_HEIGHT // 2:
-            return
-        if self.nodes[y][x]['visited']:
-            return
-
-        self.nodes[y][x]['visited'] = True
-
-        if from_x != -1:
-            if from_x < x:
-                self.nodes[from_y][from_x]['can_go_right'] = True
-            elif from_x > x:
-                self.nodes[y][x]['can_go_right'] = True
-            elif from_y < y:
-                self.nodes[from_y][from_x]['can_go_down'] = True
-            elif from_y > y:
-                self.nodes[y][x]['can_go_down'] = True
-
+    def _generate_tree(self):
+        # Randomised depth first search from block (0, 0). An explicit stack replaces the recursion so large boards
+        # cannot hit the recursion limit. Every block still shuffles its directions at the moment it is first
+        # reached, like the recursive version did, so the same generator state gives the same maze.
+        block_w, block_h = self.width // 2, self.height // 2
+        edges = bytearray(block_w * block_h)
+        visited = bytearray(block_w * block_h)
+        visited[0] = 1
+        stack = [(0, 0, self._shuffled_directions())]
+        while stack:
+            x, y, directions = stack[-1]
+            for dx, dy in directions:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < block_w and 0 <= ny < block_h and not visited[ny * block_w + nx]:
+                    visited[ny * block_w + nx] = 1
+                    if dx:
+                        edges[y * block_w + min(x, nx)] |= CAN_GO_RIGHT
+                    else:
+                        edges[min(y, ny) * block_w + x] |= CAN_GO_DOWN
+                    stack.append((nx, ny, self._shuffled_directions()))
+                    break
+            else:
+                # Every direction of this block has been tried
+                stack.pop()
+        self.edges = np.frombuffer(bytes(edges), dtype=np.uint8).reshape(block_h, block_w)
+
+    def _shuffled_directions(self):
         directions = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-        random.shuffle(directions)
-
-        for dx, dy in directions:
-            self._generate_r(x, y, x + dx, y + dy)
+        self.rng.shuffle(directions)
+        return iter(directions)
 
     def _generate_tour_number(self):
-        x, y = 0, 0
-        start_dir = Direction.UP if self._can_go_down(x, y) else Direction.LEFT
-        dir = start_dir
-        number = 0
-
-        while number < ARENA_SIZE:
-            next_dir = self._find_next_dir(x, y, dir)
-
-            if dir == Direction.RIGHT:
-                self._set_tour_number(x * 2, y * 2, number)
-                number += 1
-                if next_dir in [Direction.RIGHT, Direction.DOWN, Direction.LEFT]:
-                    self._set_tour_number(x * 2 + 1, y * 2, number)
-                    number += 1
-                if next_dir in [Direction.DOWN, Direction.LEFT]:
-                    self._set_tour_number(x * 2 + 1, y * 2 + 1, number)
-                    number += 1
-                if next_dir == Direction.LEFT:
-                    self._set_tour_number(x * 2, y * 2 + 1, number)
-                    number += 1
-            elif dir == Direction.DOWN:
-                self._set_tour_number(x * 2 + 1, y * 2, number)
-                number += 1
-                if next_dir in [Direction.DOWN, Direction.LEFT, Direction.UP]:
-                    self._set_tour_number(x * 2 + 1, y * 2 + 1, number)
-                    number += 1
-                if next_dir in [Direction.LEFT, Direction.UP]:
-                    self._set_tour_number(x * 2, y * 2 + 1, number)
-                    number += 1
-                if next_dir == Direction.UP:
-                    self._set_tour_number(x * 2, y * 2, number)
-                    number += 1
-            elif dir == Direction.LEFT:
-                self._set_tour_number(x * 2 + 1, y * 2 + 1, number)
-                number += 1
-                if next_dir in [Direction.LEFT, Direction.UP, Direction.RIGHT]:
-                    self._set_tour_number(x * 2, y * 2 + 1, number)
-                    number += 1
-                if next_dir in [Direction.UP, Direction.RIGHT]:
-                    self._set_tour_number(x * 2, y * 2, number)
-                    number += 1
-                if next_dir == Direction.RIGHT:
-                    self._set_tour_number(x * 2 + 1, y * 2, number)
-                    number += 1
-            elif dir == Direction.UP:
-                self._set_tour_number(x * 2, y * 2 + 1, number)
-                number += 1
-                if next_dir in [Direction.UP, Direction.RIGHT, Direction.DOWN]:
-                    self._set_tour_number(x * 2, y * 2, number)
-                    number += 1
-                if next_dir in [Direction.RIGHT, Direction.DOWN]:
-                    self._set_tour_number(x * 2 + 1, y * 2, number)
-                    number += 1
-                if next_dir == Direction.DOWN:
-                    self._set_tour_number(x * 2 + 1, y * 2 + 1, number)
-                    number += 1
-
-            dir = next_dir
-            if dir == Direction.RIGHT:
-                x += 1
-            elif dir == Direction.LEFT:
-                x -= 1
-            elif dir == Direction.DOWN:
-                y += 1
-            elif dir == Direction.UP:
-                y -= 1
-
-    def _find_next_dir(self, x, y, dir):
-        if dir == Direction.RIGHT:
-            if self._can_go_up(x, y): return Direction.UP
-            if self._can_go_right(x, y): return Direction.RIGHT
-            if self._can_go_down(x, y): return Direction.DOWN
-            return Direction.LEFT
-        elif dir == Direction.DOWN:
-            if self._can_go_right(x, y): return Direction.RIGHT
-            if self._can_go_down(x, y): return Direction.DOWN
-            if self._can_go_left(x, y): return Direction.LEFT
-            return Direction.UP
-        elif dir == Direction.LEFT:
-            if self._can_go_down(x, y): return Direction.DOWN
-            if self._can_go_left(x, y): return Direction.LEFT
-            if self._can_go_up(x, y): return Direction.UP
-            return Direction.RIGHT
-        elif dir == Direction.UP:
-            if self._can_go_left(x, y): return Direction.LEFT
-            if self._can_go_up(x, y): return Direction.UP
-            if self._can_go_right(x, y): return Direction.RIGHT
-            return Direction.DOWN
-
-    def _can_go_right(self, x, y):
-        return self.nodes[y][x]['can_go_right']
-
-    def _can_go_down(self, x, y):
-        return self.nodes[y][x]['can_go_down']
-
-    def _can_go_left(self, x, y):
-        return x > 0 and self.nodes[y][x - 1]['can_go_right']
-
-    def _can_go_up(self, x, y):
-        return y > 0 and self.nodes[y - 1][x]['can_go_down']
-
-    def _set_tour_number(self, x, y, number):
-        if self.tour_to_number[y][x] != 0:
-            return
-        self.tour_to_number[y][x] = number
+        # The walk keeps the tree on its right. Inside a block that means TL -> TR -> BR -> BL -> TL, and crossing a
+        # tree edge swaps two of those moves for moves into the neighbouring block, so every cell's successor only
+        # depends on its own block and can be computed for all cells at once.
+        w = self.width
+        right = (self.edges & CAN_GO_RIGHT) != 0
+        down = (self.edges & CAN_GO_DOWN) != 0
+        left = np.zeros_like(right)
+        left[:, 1:] = right[:, :-1]
+        up = np.zeros_like(down)
+        up[1:, :] = down[:-1, :]
+        block_h, block_w = self.edges.shape
+        tl = 2 * w * np.arange(block_h)[:, None] + 2 * np.arange(block_w)[None, :]
+        tr = tl + 1
+        bl = tl + w
+        br = bl + 1
+        successor = np.empty(self.size, dtype=np.int64)
+        successor[tr] = np.where(right, tr + 1, br)
+        successor[br] = np.where(down, br + w, bl)
+        successor[bl] = np.where(left, bl - 1, tl)
+        successor[tl] = np.where(up, tl - w, tr)
+
+        # The tour starts in block (0, 0): on its bottom left cell if the block has a way down, else its bottom right
+        start = w if down[0, 0] else w + 1
+        # Numbers every cell with its distance along the tour by pointer jumping: cut the cycle just before start,
+        # then each round every cell adds the count of the cell it points to and jumps twice as far, so log2(size)
+        # array operations find how many steps every cell is from the end
+        end = int(np.flatnonzero(successor == start)[0])
+        successor[end] = end
+        steps = np.ones(self.size, dtype=np.int64)
+        steps[end] = 0
+        for _ in range(self.size.bit_length()):
+            steps += steps[successor]
+            successor = successor[successor]
+        self.tour_to_number = (self.size - 1 - steps).astype(np.int32).reshape(self.height, w)
 
     def get_path_number(self, x, y):
-        return self.tour_to_number[y][x]
+        return int(self.tour_to_number[y, x])
 
     def path_distance(self, a, b):
         if a < b:
             return b - a - 1
-        return b - a - 1 + ARENA_SIZE
+        return b - a - 1 + self.size
 
 
 if __name__ == '__main__':
@@ -1,15 +1,8 @@
-import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 import numpy as np
 
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
-
-
-# font = pygame.font.SysFont('arial', 25)
-
 class Direction(Enum):
     RIGHT = 1
     LEFT = 2
@@ -30,18 +23,68 @@ BLACK = (0, 0, 0)
 BLOCK_SIZE = 20
 SPEED = 200
 
+#pygame is imported by the first GameWindow, so importing this module (or running headless games) never loads it
+pygame = None
+
+class GameWindow:
+    #The window only draws whatever state the SnakeGameAI engine hands it. Nothing in here is needed to actually play
+    #the game, so a headless engine never creates one of these and never touches pygame's display.
+    def __init__(self, w, h, caption='Snake AI with RL'):
+        global pygame
+        import pygame
+        pygame.init()
+        #The font is loaded here instead of at import time so that importing the game does not need arial.ttf
+        self.font = pygame.font.Font('arial.ttf', 25)
+        # font = pygame.font.SysFont('arial', 25)
+        # init display
+        self.display = pygame.display.set_mode((w, h))
+        #This sets the window title
+        pygame.display.set_caption(caption)
+        #This starts a clock to control the game's frame rate
+        self.clock = pygame.time.Clock()
+
+    def pump_events(self):
+        #This collects user input so the window stays responsive and can be closed
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                quit()
+
+    def draw(self, snake, food, score):
+        self.display.fill(BLACK)
+
+        for pt in snake:
+            pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
+            pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
+
+        if food is not None:
+            pygame.draw.rect(self.display, RED, pygame.Rect(food.x, food.y, BLOCK_SIZE, BLOCK_SIZE))
+
+        text = self.font.render("Score: " + str(score), True, WHITE)
+        self.display.blit(text, [0, 0])
+        pygame.display.flip()
+
+    def tick(self, speed):
+        #Speed is defined in the beginning of this file.
+        self.clock.tick(speed)
+
+
 class SnakeGameAI:
 
-    def __init__(self, w=640, h=480):
+    def __init__(self, w=640, h=480, render=True, seed=None):
         #self.w/ self.h sets the game window width and height for the environment/game
         self.w = w
         self.h = h
+        #Every game has its own random generator so a seed makes the food positions reproducible
+        self.rng = random.Random(seed)
+        #The board is also tracked in grid cells so the snake's body can be looked up by cell instead of by scanning
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        #render=False runs the game as a pure simulation: no window, no event pump and no frame rate limit. This is
+        #what training should use since the clock otherwise caps the number of steps per second.
+        self.render = render
         # init display
-        self.display = pygame.display.set_mode((self.w, self.h))
-        #This sets the window title
-        pygame.display.set_caption('Snake AI with RL')
-        #This starts a clock to control the game's frame rate
-        self.clock = pygame.time.Clock()
+        self.window = GameWindow(self.w, self.h) if self.render else None
         #This resets the game state of the snake, the apple, the direction, the score, ect more on this later.
         self.reset()
 
@@ -53,11 +96,21 @@ class SnakeGameAI:
         #Sets the head of the snake in the middle of the game when reset
         self.head = Point(self.w / 2, self.h / 2)
 
-        #This is the list that is created to instantiate the snake with the head in the middle and the two blocks to the
-        #left being apart of the body. This will be appended to to increase the legnth of the snake.
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        #This is the deque that is created to instantiate the snake with the head in the middle and the two blocks to the
+        #left being apart of the body. A deque is used so adding a new head and popping the tail are both O(1).
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        #occupancy counts how many pieces of the snake are on each cell. It is updated every time a piece is added or
+        #removed so checking if a cell is part of the snake never has to scan the body.
+        self.occupancy = bytearray(self.cols * self.rows)
+        #free_cells is every cell without a piece of the snake on it in no particular order and free_pos[cell] is where
+        #that cell sits in free_cells (-1 when it is taken). Cells are swapped to the end before being removed so
+        #adding, removing and picking a random free cell are all O(1).
+        self.free_cells = list(range(self.cols * self.rows))
+        self.free_pos = list(range(self.cols * self.rows))
+        for pt in self.snake:
+            self._occupy(pt)
         #This resets that score back to 0
         self.score = 0
         #This is a placeholder for the food which is later handled by th _place_food.
@@ -70,29 +123,28 @@ class SnakeGameAI:
 
 
     def _place_food(self):
-        #This generates a random a and y coordinate for the food to be places when this function is called
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        #This if statement checks if the food is within the list snake and if it is then it recursively calls this
-        #function to ensure that the food is not being placed in the snake.
-        if self.food in self.snake:
-            self._place_food()
+        #If the snake fills the whole board there is nowhere left for food and the game has been won
+        if not self.free_cells:
+            self.food = None
+            return
+        #This picks a random cell out of the free cells, so the food can never be placed in the snake and no retries
+        #are needed even when the board is almost full.
+        cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
 
     def play_step(self, action):
         #This increments the frame counter to track the games progress.
         self.frame_iteration += 1
         # 1. collect user input
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+        if self.window is not None:
+            self.window.pump_events()
 
         # 2. move this updates the head of the snake
         self._move(action)  # update the head
         #This inserts the new head position at the beginning of the self.snake head to make it seem like the snake is
         #slithering and it also moves the snake to the next point that the snake it directed to.
-        self.snake.insert(0, self.head)
+        self.snake.appendleft(self.head)
+        self._occupy(self.head)
 
         # 3. check if game over
         reward = 0
@@ -114,15 +166,19 @@ class SnakeGameAI:
             reward = 10
             #If the food is touching the snake then _place_food() is called to create another food in the game.
             self._place_food()
+            #No food left means the snake covers the whole board so the game is over
+            if self.food is None:
+                game_over = True
+                return reward, game_over, self.score
         else:
             #Because at the beginning of this function we are going to insert a new cord in the self.snake list we have
             #to remove the last element to give the impression that we are moving forward.
-            self.snake.pop()
+            self._vacate(self.snake.pop())
 
         # 5. update ui and clock
-        self._update_ui()
-        #Speed is defined in the beginning of this file.
-        self.clock.tick(SPEED)
+        if self.window is not None:
+            self._update_ui()
+            self.window.tick(SPEED)
         # 6. return game over and score
         return reward, game_over, self.score
 
@@ -132,24 +188,41 @@ class SnakeGameAI:
         # hits boundary
         if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0:
             return True
-        # hits itself
-        if pt in self.snake[1:]:
+        # hits itself. This is the same as checking pt in self.snake[1:]: the head's own cell is counted once
+        #for the head, so for the head only a second piece on that cell is a collision.
+        if self.occupancy[self.cell_index(pt)] > (pt == self.head):
             return True
 
         return False
 
-    def _update_ui(self):
-        self.display.fill(BLACK)
+    def cell_index(self, pt):
+        #This converts a point in pixels to the index of its grid cell
+        return int(pt.y // BLOCK_SIZE) * self.cols + int(pt.x // BLOCK_SIZE)
 
-        for pt in self.snake:
-            pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
-            pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
+    def _occupy(self, pt):
+        #Off board points (the head after hitting a wall) have no cell so they are not tracked
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            if self.occupancy[cell] == 0:
+                #Swap the cell with the last free cell and pop it off the end
+                last = self.free_cells.pop()
+                if last != cell:
+                    self.free_cells[self.free_pos[cell]] = last
+                    self.free_pos[last] = self.free_pos[cell]
+                self.free_pos[cell] = -1
+            self.occupancy[cell] += 1
 
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+    def _vacate(self, pt):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            cell = self.cell_index(pt)
+            self.occupancy[cell] -= 1
+            if self.occupancy[cell] == 0:
+                self.free_pos[cell] = len(self.free_cells)
+                self.free_cells.append(cell)
+
+    def _update_ui(self):
+        self.window.draw(self.snake, self.food, self.score)
 
-        text = font.render("Score: " + str(self.score), True, WHITE)
-        self.display.blit(text, [0, 0])
-        pygame.display.flip()
     #self refers to the instance of the SnakeGameAI class and then action represents the movement decisions that the AI
     #makes with [1, 0, 0] coninuing straight, [0, 1, 0] turning right and, [0, 0, 1] turning left.
     def _move(self, action):
@@ -192,3 +265,160 @@ class SnakeGameAI:
         #This creates a new Point object for the snake's head using the updates x and y cords
         self.head = Point(x, y)
 
+
+#The clockwise direction order used by VecSnakeEnv (RIGHT, DOWN, LEFT, UP) stored as small ints so whole batches of
+#games can be turned with one modulo. TURN maps the action index (straight, right, left) onto a step in that order.
+VEC_DX = np.array([1, 0, -1, 0])
+VEC_DY = np.array([0, 1, 0, -1])
+VEC_TURN = np.array([0, 1, -1])
+
+
+class VecSnakeEnv:
+    #VecSnakeEnv plays n_games copies of SnakeGameAI in lockstep. Every game is a row in a set of NumPy arrays so one
+    #call to step() moves all of them at once. A game ends when it hits a wall or itself (-10), runs past the
+    #100 * length move limit (-10) or eats the last free cell (+10), and is reset straight away so the batch always
+    #stays full. get_states builds the same 11 features as Agent.get_state.
+    def __init__(self, n_games, w=640, h=480, seed=None):
+        self.n_games = n_games
+        self.cols = w // BLOCK_SIZE
+        self.rows = h // BLOCK_SIZE
+        self.n_cells = self.cols * self.rows
+        #Every game starts with its head in the middle of the board like SnakeGameAI.reset
+        self.start_cell = (h // 2 // BLOCK_SIZE) * self.cols + (w // 2 // BLOCK_SIZE)
+        #Seeding the generator makes the food positions (and so whole runs) reproducible
+        self.rng = np.random.default_rng(seed)
+        #grid[i, cell] is True when game i has a piece of the snake on that cell. Cells are numbered y * cols + x.
+        self.grid = np.zeros((n_games, self.n_cells), dtype=bool)
+        #body is a ring buffer of cells per game. head_ptr points at the head and the tail sits length - 1 slots behind
+        #it, so moving the snake only writes one slot instead of shifting the whole body.
+        self.capacity = self.n_cells + 1
+        self.body = np.zeros((n_games, self.capacity), dtype=np.int32)
+        self.head_ptr = np.zeros(n_games, dtype=np.int64)
+        self.length = np.zeros(n_games, dtype=np.int64)
+        #direction is an index into VEC_DX/VEC_DY
+        self.direction = np.zeros(n_games, dtype=np.int64)
+        #food is a cell index or -1 when the board is completely full
+        self.food = np.zeros(n_games, dtype=np.int64)
+        self.score = np.zeros(n_games, dtype=np.int64)
+        self.frame_iteration = np.zeros(n_games, dtype=np.int64)
+        #episode_scores holds the final score of every game that ended during the last step (only valid where done)
+        self.episode_scores = np.zeros(n_games, dtype=np.int64)
+        self._all = np.arange(n_games)
+        self.reset()
+
+    def reset(self, games=None):
+        #Resets the given game indices (or every game) to the same start position SnakeGameAI uses and returns the
+        #states of all games
+        self._reset_games(self._all if games is None else np.asarray(games))
+        return self.get_states()
+
+    def _reset_games(self, games):
+        #The reset itself, without building any states. step() uses this since it builds the states afterwards anyway.
+        if games.size == 0:
+            return
+        head = self.start_cell
+        self.grid[games] = False
+        self.body[games, 0] = head - 2
+        self.body[games, 1] = head - 1
+        self.body[games, 2] = head
+        self.grid[games, head - 2] = True
+        self.grid[games, head - 1] = True
+        self.grid[games, head] = True
+        self.head_ptr[games] = 2
+        self.length[games] = 3
+        self.direction[games] = 0
+        self.score[games] = 0
+        self.frame_iteration[games] = 0
+        self._place_food(games)
+
+    def _place_food(self, games):
+        #Picks a uniformly random free cell for every game in games by giving each free cell a random key and taking
+        #the largest one. This never retries, even when the board is almost full.
+        keys = self.rng.random((games.size, self.n_cells))
+        keys[self.grid[games]] = -1.0
+        food = keys.argmax(axis=1)
+        food[keys[np.arange(games.size), food] < 0] = -1
+        self.food[games] = food
+
+    def step(self, actions):
+        #actions is an [N, 3] array of one hot moves ([1, 0, 0] straight, [0, 1, 0] right, [0, 0, 1] left) or an [N]
+        #array of move indices like Agent.get_actions returns. Returns the [N, 11] states after the move, the [N]
+        #rewards and the [N] done flags.
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+        self.direction = (self.direction + VEC_TURN[actions]) % 4
+
+        head = self.body[self._all, self.head_ptr]
+        x = head % self.cols + VEC_DX[self.direction]
+        y = head // self.cols + VEC_DY[self.direction]
+        out_of_bounds = (x < 0) | (x >= self.cols) | (y < 0) | (y >= self.rows)
+        new_head = np.where(out_of_bounds, 0, y * self.cols + x)
+        #The old tail is still on the grid at this point which matches SnakeGameAI checking snake[1:] before it pops
+        hit_self = ~out_of_bounds & self.grid[self._all, new_head]
+
+        self.frame_iteration += 1
+        timed_out = self.frame_iteration > 100 * (self.length + 1)
+        dones = out_of_bounds | hit_self | timed_out
+        alive = ~dones
+        ate = alive & (new_head == self.food)
+
+        rewards = np.zeros(self.n_games, dtype=np.float32)
+        rewards[dones] = -10
+        rewards[ate] = 10
+
+        #Move the head of every game that is still alive
+        moved = np.flatnonzero(alive)
+        self.head_ptr[moved] = (self.head_ptr[moved] + 1) % self.capacity
+        self.body[moved, self.head_ptr[moved]] = new_head[moved]
+        self.grid[moved, new_head[moved]] = True
+
+        #Games that did not eat drop their tail, games that ate grow by one and get new food
+        slid = np.flatnonzero(alive & ~ate)
+        tail = self.body[slid, (self.head_ptr[slid] - self.length[slid]) % self.capacity]
+        self.grid[slid, tail] = False
+        grew = np.flatnonzero(ate)
+        self.length[grew] += 1
+        self.score[grew] += 1
+        self._place_food(grew)
+        #A game with no free cell left for food has been won and ends like SnakeGameAI.play_step ends it, keeping
+        #its reward of 10
+        dones[grew[self.food[grew] < 0]] = True
+
+        finished = np.flatnonzero(dones)
+        self.episode_scores[finished] = self.score[finished]
+        self._reset_games(finished)
+        return self.get_states(), rewards, dones
+
+    def get_states(self, out=None):
+        #Builds the same 11 features as Agent.get_state for every game at once as an [N, 11] uint8 array
+        if out is None:
+            out = np.empty((self.n_games, 11), dtype=np.uint8)
+        head = self.body[self._all, self.head_ptr]
+        hx = head % self.cols
+        hy = head // self.cols
+
+        #danger[i, d] is True when moving one cell in absolute direction d would be a collision for game i
+        nx = hx[:, None] + VEC_DX[None, :]
+        ny = hy[:, None] + VEC_DY[None, :]
+        out_of_bounds = (nx < 0) | (nx >= self.cols) | (ny < 0) | (ny >= self.rows)
+        cells = np.where(out_of_bounds, 0, ny * self.cols + nx)
+        danger = out_of_bounds | self.grid[self._all[:, None], cells]
+
+        #Danger straight, right and left are the absolute dangers looked up relative to the current direction
+        out[:, 0] = danger[self._all, self.direction]
+        out[:, 1] = danger[self._all, (self.direction + 1) % 4]
+        out[:, 2] = danger[self._all, (self.direction - 1) % 4]
+        #Move direction in the order left, right, up, down
+        out[:, 3] = self.direction == 2
+        out[:, 4] = self.direction == 0
+        out[:, 5] = self.direction == 3
+        out[:, 6] = self.direction == 1
+        #Food location
+        fx = self.food % self.cols
+        fy = self.food // self.cols
+        out[:, 7] = fx < hx
+        out[:, 8] = fx > hx
+        out[:, 9] = fy < hy
+        out[:, 10] = fy > hy
+        return out
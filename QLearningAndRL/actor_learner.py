@@ -0,0 +1,193 @@
+import argparse
+import os
+import queue
+from functools import partial
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from SnakeGame import SnakeGameAI
+from model import Linear_QNet
+from agent import Agent, InitialEpsilonNum, pick_moves, greedy_moves
+from helper import MetricsLogger
+from checkpoint import CheckpointManager
+from scheduler import UpdateScheduler, TRAIN_EVERY, STEP_BATCH_SIZE, UPDATES_PER_GAME
+
+#Every actor sends its experiences to the learner in chunks of this many steps instead of one at a time
+CHUNK_SIZE = 256
+#The learner copies its weights to the actors after this many updates
+SYNC_EVERY = 20
+#Optional caps on the minibatch and long memory updates the learner runs each time it empties the queue. Without them
+#it runs every update the schedule asks for. With them a learner that falls behind drops the updates over the cap
+#(counted as dropped_updates in the metrics) so the actors never wait, at the cost of fewer updates per step than
+#train_every asks for.
+MAX_STEP_UPDATES = None
+MAX_GAME_UPDATES = None
+
+
+def actor(actor_id, shared_model, version, lock, games, experiences, stop, chunk_size, seed):
+    #An actor plays headless games with its own copy of the network and streams what happened to the learner. It never
+    #trains, it only reloads the learner's weights whenever a newer version has been published.
+    #Every actor gets one thread so N actors do not fight over the same cores
+    torch.set_num_threads(1)
+    #An actor only plays, so it keeps a copy of the network and an exploration generator instead of a whole Agent with
+    #a replay memory and an optimizer it would never use
+    model = Linear_QNet(11, 256, 3)
+    rng = np.random.default_rng()
+    predict_moves = partial(greedy_moves, model)
+    game = SnakeGameAI(render=False, seed=seed)
+    local_version = -1
+    states = np.zeros((chunk_size, 11), dtype=np.uint8)
+    actions = np.zeros((chunk_size, 3), dtype=np.int8)
+    rewards = np.zeros(chunk_size, dtype=np.float32)
+    next_states = np.zeros((chunk_size, 11), dtype=np.uint8)
+    dones = np.zeros(chunk_size, dtype=bool)
+    scores = []
+    n = 0
+    while not stop.is_set():
+        if version.value != local_version:
+            with lock:
+                model.load_state_dict(shared_model.state_dict())
+                local_version = version.value
+
+        #The states are written straight into the chunk
+        Agent.get_state(game, states[n])
+        #Exploration follows the total number of games played by all actors, like it would in a single train() loop
+        move = pick_moves(states[n:n + 1], InitialEpsilonNum - games.value, rng, predict_moves)[0]
+        actions[n] = 0
+        actions[n, move] = 1
+        reward, done, score = game.play_step(actions[n])
+        Agent.get_state(game, next_states[n])
+
+        rewards[n] = reward
+        dones[n] = done
+        n += 1
+        if done:
+            game.reset()
+            with games.get_lock():
+                games.value += 1
+            scores.append(score)
+
+        if n == chunk_size:
+            #Blocks if the learner is behind, which keeps the actors from running off with stale weights
+            while not stop.is_set():
+                try:
+                    experiences.put((actor_id, states.copy(), actions.copy(), rewards.copy(), next_states.copy(),
+                                     dones.copy(), scores), timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            scores = []
+            n = 0
+
+
+def train_parallel(n_actors=None, max_games=None, prioritized=False, chunk_size=CHUNK_SIZE, sync_every=SYNC_EVERY,
+                   metrics_path='metrics.jsonl', train_every=TRAIN_EVERY, step_batch_size=STEP_BATCH_SIZE,
+                   updates_per_game=UPDATES_PER_GAME, target_update=0, tau=None, double=False,
+                   max_step_updates=MAX_STEP_UPDATES, max_game_updates=MAX_GAME_UPDATES):
+    #Runs n_actors actor processes and uses this process as the learner. The learner owns the replay memory and the
+    #QTrainer: it empties the queue of experience chunks, trains on them and publishes its weights back to the actors
+    #through a model that lives in shared memory.
+    if n_actors is None:
+        n_actors = max(1, (os.cpu_count() or 2) - 1)
+    ctx = mp.get_context('spawn')
+    agent = Agent(prioritized=prioritized, target_update=target_update, tau=tau, double=double)
+    scheduler = UpdateScheduler(agent, train_every, step_batch_size, updates_per_game)
+
+    shared_model = Linear_QNet(11, 256, 3)
+    shared_model.load_state_dict(agent.model.state_dict())
+    shared_model.share_memory()
+    version = ctx.Value('i', 0)
+    lock = ctx.Lock()
+    games = ctx.Value('i', 0)
+    experiences = ctx.Queue(maxsize=4 * n_actors)
+    stop = ctx.Event()
+
+    actors = [ctx.Process(target=actor, args=(i, shared_model, version, lock, games, experiences, stop, chunk_size, i),
+                          daemon=True)
+              for i in range(n_actors)]
+    for p in actors:
+        p.start()
+
+    metrics = MetricsLogger(metrics_path)
+    #Record models are written in the background so saving one never stalls the learner
+    checkpoints = CheckpointManager()
+    record = 0
+    total_score = 0
+    updates = 0
+    try:
+        while max_games is None or agent.numberofgames < max_games:
+            #Waits for one chunk and then takes every other chunk that is already queued, so the actors never block on
+            #a full queue while the learner trains
+            chunks = [experiences.get()]
+            while True:
+                try:
+                    chunks.append(experiences.get_nowait())
+                except queue.Empty:
+                    break
+            n_steps = 0
+            scores = []
+            for _, states, actions, rewards, next_states, dones, chunk_scores in chunks:
+                agent.memory.extend(states, actions, rewards, next_states, dones)
+                n_steps += len(rewards)
+                scores.extend(chunk_scores)
+            #The scheduler trains on the new steps and on every game that finished in them, up to the caps
+            updates += scheduler.step(n_steps, max_step_updates)
+            updates += scheduler.game_over(len(scores), max_game_updates)
+            for score in scores:
+                agent.numberofgames += 1
+                total_score += score
+                if score > record:
+                    record = score
+                    checkpoints.save_model(agent.model, agent.MODEL_FILE)
+                mean_score = total_score / agent.numberofgames
+                stats = scheduler.stats()
+                print('Game', agent.numberofgames, 'Score', score, 'Record', record,
+                      'Mean', round(mean_score, 2), 'Steps/s', int(stats['steps_per_second']))
+                metrics.log(game=agent.numberofgames, score=score, mean_score=mean_score, record=record, **stats)
+            if updates >= sync_every:
+                with lock:
+                    shared_model.load_state_dict(agent.model.state_dict())
+                    version.value += 1
+                updates = 0
+    finally:
+        stop.set()
+        #Empties the queue so actors that are blocked on put() can see the stop flag and exit
+        while any(p.is_alive() for p in actors):
+            try:
+                experiences.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for p in actors:
+            p.join()
+        metrics.close()
+        checkpoints.close()
+    return agent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the snake agent with parallel actor processes')
+    parser.add_argument('--actors', type=int, default=None, help='number of actor processes (default: cores - 1)')
+    parser.add_argument('--games', type=int, default=None, help='stop after this many games')
+    parser.add_argument('--prioritized', action='store_true', help='use prioritized experience replay')
+    parser.add_argument('--metrics', default='metrics.jsonl', help='file the scores are written to')
+    parser.add_argument('--train-every', type=int, default=TRAIN_EVERY, help='steps between minibatch updates')
+    parser.add_argument('--batch-size', type=int, default=STEP_BATCH_SIZE, help='minibatch size for those updates')
+    parser.add_argument('--updates-per-game', type=int, default=UPDATES_PER_GAME,
+                        help='long memory updates when a game ends')
+    parser.add_argument('--target-update', type=int, default=0, metavar='N',
+                        help='use a target network copied from the model every N updates')
+    parser.add_argument('--tau', type=float, default=None,
+                        help='use a target network that follows the model by Polyak averaging with this rate')
+    parser.add_argument('--double', action='store_true', help='use the Double DQN target (needs a target network)')
+    parser.add_argument('--max-step-updates', type=int, default=MAX_STEP_UPDATES,
+                        help='most minibatch updates the learner runs each time it empties the queue, dropping the '
+                             'rest (default: no cap)')
+    parser.add_argument('--max-game-updates', type=int, default=MAX_GAME_UPDATES,
+                        help='most long memory updates the learner runs each time it empties the queue, dropping '
+                             'the rest (default: no cap)')
+    args = parser.parse_args()
+    train_parallel(n_actors=args.actors, max_games=args.games, prioritized=args.prioritized,
+                   metrics_path=args.metrics, train_every=args.train_every, step_batch_size=args.batch_size,
+                   updates_per_game=args.updates_per_game, target_update=args.target_update, tau=args.tau,
+                   double=args.double, max_step_updates=args.max_step_updates,
+                   max_game_updates=args.max_game_updates)
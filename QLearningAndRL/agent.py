@@ -1,13 +1,12 @@
 
-import torch
-import random
+import argparse
 import numpy as np
-from SnakeGame import SnakeGameAI, Direction, Point
-from collections import deque
-from model import Linear_QNet, QTrainer
-from helper import plot
+from SnakeGame import SnakeGameAI, VecSnakeEnv, Direction, BLOCK_SIZE
+from helper import MetricsLogger
+from scheduler import UpdateScheduler, TRAIN_EVERY, STEP_BATCH_SIZE, UPDATES_PER_GAME
 
-from sympy.physics.quantum.operatorset import state_mapping
+#torch (and model, memory and checkpoint, which need it) is only imported once an Agent is made or a model is
+#evaluated, so the game, the state features and the CLI start without paying for it
 #MAX_MEMORY is in charge of limiting the size of the experience replay buffer to x amount of experiences
 MAX_MEMORY = 100_000
 #Batch_SIZE is the # of experiences sampled for training at each step
@@ -16,10 +15,27 @@ BATCH_SIZE = 10000
 LR = 0.0005
 #This is used to determine the running epsilon number
 InitialEpsilonNum = 100
+#The position of every direction in the clockwise order RIGHT, DOWN, LEFT, UP. Turning right is +1 and left is -1.
+CLOCK_WISE_INDEX = {Direction.RIGHT: 0, Direction.DOWN: 1, Direction.LEFT: 2, Direction.UP: 3}
 
 class Agent:
+    #File under ./model the best model is saved to
+    MODEL_FILE = 'model.pth'
 
-    def __init__(self):
+    def __init__(self, prioritized=False, target_update=0, tau=None, double=False):
+        from model import Linear_QNet, QTrainer
+        self._setup_memory_and_exploration(prioritized)
+        #MODEL is the neural network that has (11 input features, 256 hidden units in single layer, 3 outputs)
+        self.model = Linear_QNet(11, 256, 3)
+        #TRAINER is an instance of QTrainer for training the model using the replay buffer. target_update, tau and
+        #double turn on its target network and the Double DQN rule.
+        self.trainer = QTrainer(self.model, lr=LR, gamma = self.gamma, target_update=target_update, tau=tau,
+                                double=double)
+
+    def _setup_memory_and_exploration(self, prioritized):
+        #Everything an agent needs apart from its model and trainer. Subclasses with a different kind of model (like
+        #TabularAgent) call this and then set self.model and self.trainer themselves.
+        from memory import ReplayBuffer, PrioritizedReplayBuffer
         #Tracks the number of games played by the Agnet
         self.numberofgames = 0
         #This is a factor controlling exploration. It promotes the snake to explore more in the beginning and then
@@ -28,163 +44,338 @@ class Agent:
         #Gamma places a balance on future rewards and immediate rewards. ie it balances short term and long term rewards
         self.gamma = 0.95
         #memory is a replay buffer that stores states, actions, rewards, next states, and game completion
-        self.memory = deque(maxlen=MAX_MEMORY)
-        #MODEL is the neural network that has (11 input features, 256 hidden units in single layer, 3 outputs)
-        self.model = Linear_QNet(11, 256, 3)
-        #TRAINER is an instance of QTrainer for training the model using the replay buffer.
-        self.trainer = QTrainer(self.model, lr=LR, gamma = self.gamma)
-
-    def get_state(self, game):
-
-        head = game.snake[0]
-        #This creates points for each direction to detect potential collisions. It creates a kind of field around the
-        #snakes head
-        point_l = Point(head.x - 20, head.y)
-        point_r = Point(head.x + 20, head.y)
-        point_u = Point(head.x, head.y - 20)
-        point_d = Point(head.x, head.y + 20)
-        #This gets the current direction of the snakes movement
-        dir_l = game.direction == Direction.LEFT
-        dir_r = game.direction == Direction.RIGHT
-        dir_u = game.direction == Direction.UP
-        dir_d = game.direction == Direction.DOWN
-
-        state = [
-            #Danger straight
-            (dir_r and game.is_collision(point_r)) or
-            (dir_l and game.is_collision(point_l)) or
-            (dir_u and game.is_collision(point_u)) or
-            (dir_d and game.is_collision(point_d)),
-
-            #Danger to the right
-            (dir_u and game.is_collision(point_r)) or
-            (dir_d and game.is_collision(point_l)) or
-            (dir_l and game.is_collision(point_u)) or
-            (dir_r and game.is_collision(point_d)),
-
-            # Danger to the left
-            (dir_d and game.is_collision(point_r)) or
-            (dir_u and game.is_collision(point_l)) or
-            (dir_r and game.is_collision(point_u)) or
-            (dir_l and game.is_collision(point_d)),
-
-            #Most direction
-            dir_l,
-            dir_r,
-            dir_u,
-            dir_d,
+        #With prioritized=True experiences with large TD errors (mostly deaths) are replayed more often than the rest
+        self.prioritized = prioritized
+        if self.prioritized:
+            self.memory = PrioritizedReplayBuffer(MAX_MEMORY)
+        else:
+            self.memory = ReplayBuffer(MAX_MEMORY)
+        #Random generator for the exploration draws in get_actions
+        self.rng = np.random.default_rng()
+
+    @staticmethod
+    def get_state(game, out=None):
+        #Builds the 11 state features straight from the game's occupancy grid. out can be a preallocated uint8 array of
+        #length 11 (or a row of a bigger one) that the features are written into so nothing new has to be created.
+        #It only reads the game, so it can also be called as Agent.get_state(game) without an Agent.
+        if out is None:
+            out = np.empty(11, dtype=np.uint8)
+        head = game.head
+        #This gets the grid cell of the snakes head and the cell index used by the occupancy grid
+        x = int(head.x // BLOCK_SIZE)
+        y = int(head.y // BLOCK_SIZE)
+        cols = game.cols
+        occupancy = game.occupancy
+        #This checks the field around the snakes head: the cell to the right, below, to the left and above. A cell is
+        #dangerous if it is off the board or if a piece of the snake is on it (the head never neighbours itself).
+        if 0 <= x < cols and 0 <= y < game.rows:
+            cell = y * cols + x
+            danger = (x + 1 >= cols or occupancy[cell + 1] > 0,
+                      y + 1 >= game.rows or occupancy[cell + cols] > 0,
+                      x - 1 < 0 or occupancy[cell - 1] > 0,
+                      y - 1 < 0 or occupancy[cell - cols] > 0)
+        else:
+            #The head is only off the board right after hitting a wall, so the slower bounds check is fine here
+            danger = tuple(Agent._is_danger(game, x + dx, y + dy) for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1)))
+        #This gets the current direction of the snakes movement as a position in the clockwise order above
+        d = CLOCK_WISE_INDEX[game.direction]
+        food = game.food if game.food is not None else head
+
+        out[:] = (
+            #Danger straight, to the right and to the left, looked up relative to the direction the snake is facing
+            danger[d],
+            danger[(d + 1) % 4],
+            danger[(d - 1) % 4],
+
+            #Move direction (left, right, up, down)
+            d == 2,
+            d == 0,
+            d == 3,
+            d == 1,
 
             #Food Location
-            game.food.x < game.head.x,
-            game.food.x > game.head.x,
-            game.food.y < game.head.y,
-            game.food.y > game.head.y
-        ]
-        #This converts the state list into a numpy array which is useful when it comes to being more memory-efficient
-        #as well as conforming to tensor format.
-        return np.array(state, dtype = int)
+            food.x < head.x,
+            food.x > head.x,
+            food.y < head.y,
+            food.y > head.y
+        )
+        return out
+
+    @staticmethod
+    def _is_danger(game, x, y):
+        return not (0 <= x < game.cols and 0 <= y < game.rows) or game.occupancy[y * game.cols + x] > 0
+
+    def get_states(self, games, out=None):
+        #Batched version of get_state for a list of SnakeGameAI games, giving an [N, 11] uint8 array. (VecSnakeEnv
+        #games build the same array with VecSnakeEnv.get_states.)
+        if out is None:
+            out = np.empty((len(games), 11), dtype=np.uint8)
+        for i, game in enumerate(games):
+            self.get_state(game, out[i])
+        return out
 
     def remember(self, state, action, reward, next_state, done):
         #This stores a single experience in the memory buffer
         #This is important because it prevents overfitting to recent experiences and helps stabilize the training.
-        self.memory.append((state, action, reward, next_state, done)) # popleft if  MAX_MEMORY is reached
+        self.memory.append(state, action, reward, next_state, done) # overwrites the oldest if MAX_MEMORY is reached
 
     def train_long_memory(self):
-        #This samples a batch of experiences for training
-        if len(self.memory) > BATCH_SIZE:
-        #If the memory BUFFER conains more than the batch_size then we will randomly sample Batch_size experiences from
-        #selfmemory using random.sample
-            mini_sample = random.sample(self.memory, BATCH_SIZE) #returns a list of tuples
-        else:
-            #We use all experiences in memory because batchsize has not been reached yet.
-            mini_sample = self.memory
-        #This unpacks all the samples that are either smaller than or equal to the batchsize amd then it brakes them
-        #into seperate lists.
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
+        #Experience replay over a large batch of everything remembered so far
+        self.train_batch(BATCH_SIZE)
+
+    def train_batch(self, batch_size):
+        #This samples a batch of experiences for training. If the memory buffer contains more than the batch_size then
+        #Batch_size random experiences are picked, otherwise every experience in memory is used. The buffer hands them
+        #back already split into one tensor per field.
+        if self.prioritized:
+            #The prioritized buffer also returns the importance sampling weights and which rows were picked, so the
+            #rows can get new priorities from the TD errors of this update.
+            states, actions, rewards, next_states, dones, weights, idx = self.memory.sample(batch_size)
+            td_errors = self.trainer.train_step(states, actions, rewards, next_states, dones, weights)
+            self.memory.update_priorities(idx, td_errors)
+            return
+        states, actions, rewards, next_states, dones = self.memory.sample(batch_size)
         #Calling the train_step method of the QTrainer allows for the agent to update the neural network based on the
         #sampled experiences.
         self.trainer.train_step(states, actions, rewards, next_states, dones)
 
-    #this trains the model immediately with the last experience
-    #Takes in the current state of the environment, the action taken in the current state, the reward recieved by the
-    #action, the resulting state after the action is executed, and then the bool if the game is over or not.
-    def train_short_memory(self, state, action, reward, next_state, done):
-        self.trainer.train_step(state, action, reward, next_state, done)
-
-
     def get_action(self, state):
-        #Sets an epsilon number which was initiated with the value of 0. Higher epsilon equates to higher levels of
-        #exploration lower espilon leads to model predictions over exploration.
-        self.epsilon = InitialEpsilonNum - self.numberofgames
-        #We then initialize final_move
+        #We initialize final_move and set the move picked for this one state to 1
         final_move = [0, 0, 0]
-        #This finds a random integer from 0 to 200 to compare to epsilon and if it is smaller than the agent will
-        #explore by picking a random move.
-        if random.randint(0, 200) < self.epsilon:\
-            #Random int from 0 o 2 is chosen and then from there the final move index is set to 1 which indicated the
-            #the selected move.
-            move = random.randint(0, 2)
-            final_move[move] = 1
-        else:
-            #If agent isn't exploring then the state is converted into PyTorch tensor of type float.
-            state0 = torch.tensor(state, dtype=torch.float)
-            #The neural network model (self.model) preducts the Q-values for each possible move given to the current state
-            prediction = self.model(state0)
-            #This finds the index of the move with the highest Q-value, and .item() converts it into a Python integer
-            move = torch.argmax(prediction).item()
-            #Corresponding move is set in final_move.
-            final_move[move] = 1
+        move = self.get_actions([state])[0]
+        final_move[move] = 1
         return final_move
 
-def train():
-    #This initializes a list for plot_scores and means
-    plot_scores = []
-    plot_mean_scores = []
+    def get_actions(self, states, epsilon=None):
+        #Picks a move for a whole [N, 11] batch of states at once and returns the move indices (0 straight, 1 right,
+        #2 left) as an int array. epsilon can be one number for every game or an array with one epsilon per game.
+        #By default it is the same running epsilon number get_action has always used.
+        states = np.asarray(states)
+        if epsilon is None:
+            #Higher epsilon equates to higher levels of exploration lower espilon leads to model predictions
+            self.epsilon = InitialEpsilonNum - self.numberofgames
+            epsilon = self.epsilon
+        return pick_moves(states, epsilon, self.rng, self.predict_moves)
+
+    def predict_moves(self, states):
+        return greedy_moves(self.model, states)
+
+def pick_moves(states, epsilon, rng, predict_moves):
+    #Epsilon greedy moves for an [N, 11] batch of states, drawn from rng. predict_moves maps the batch to the greedy move
+    #indices and is only called when at least one game does not explore.
+    n = len(states)
+    #One draw for every game: a random integer from 0 to 200 smaller than epsilon means that game explores
+    explore = rng.integers(0, 201, size=n) < epsilon
+    if explore.all():
+        return rng.integers(0, 3, size=n)
+    moves = predict_moves(states)
+    #Exploring games get a random move instead
+    if explore.any():
+        moves[explore] = rng.integers(0, 3, size=int(explore.sum()))
+    return moves
+
+def greedy_moves(model, states):
+    #The model predicts the Q-values of the whole batch in one forward pass. inference_mode skips all the autograd
+    #bookkeeping since these predictions are never trained on.
+    import torch
+    with torch.inference_mode():
+        prediction = model(torch.as_tensor(states, dtype=torch.float))
+        #This finds the index of the move with the highest Q-value for each game
+        return torch.argmax(prediction, dim=1).numpy()
+
+def make_agent(prioritized=False, target_update=0, tau=None, double=False, tabular=False):
+    #tabular=True gives a TabularAgent (tabular.py) that learns a Q-table instead of the network. The target network
+    #options only apply to the network.
+    if tabular:
+        from tabular import TabularAgent
+        return TabularAgent(prioritized=prioritized)
+    return Agent(prioritized=prioritized, target_update=target_update, tau=tau, double=double)
+
+def train(render=True, prioritized=False, metrics_path='metrics.jsonl', resume=False, checkpoint_every=100,
+          keep_checkpoints=3, save_memory=False, train_every=TRAIN_EVERY, step_batch_size=STEP_BATCH_SIZE,
+          updates_per_game=UPDATES_PER_GAME, target_update=0, tau=None, double=False, tabular=False, seed=None,
+          max_games=None):
+    #Scores are written to metrics_path in the background instead of being plotted here. Watch them live with
+    #python helper.py metrics.jsonl
+    metrics = MetricsLogger(metrics_path)
     #accumulates the total score across all games for calculating the mean score.
     total_score = 0
     #Tracks the highest score
     record = 0
     #This calls the Agent object thich handles decision making and training
-    agent = Agent()
-    #This creates an instance of SnakeGameAI
-    game = SnakeGameAI()
-    while True:
+    agent = make_agent(prioritized, target_update, tau, double, tabular)
+    #The scheduler decides when to train: a minibatch every train_every moves plus updates_per_game long memory
+    #updates whenever a game ends
+    scheduler = UpdateScheduler(agent, train_every, step_batch_size, updates_per_game)
+    #This creates an instance of SnakeGameAI. With render=False the game runs headless and as fast as the CPU allows.
+    #seed makes the food positions reproducible.
+    game = SnakeGameAI(render=render, seed=seed)
+    #A full checkpoint is written in the background every checkpoint_every games. With resume=True training picks up
+    #from the newest one, including the optimizer state, the game's food generator, the scheduler's counters and
+    #(with save_memory=True) the replay memory. With the memory saved a resumed run ends up with exactly the weights
+    #the uninterrupted run would have had.
+    from checkpoint import CheckpointManager
+    checkpoints = CheckpointManager(keep=keep_checkpoints, save_memory=save_memory)
+    if resume:
+        restored = checkpoints.load(agent, game=game, scheduler=scheduler)
+        if restored is not None:
+            record, total_score = restored
+    #The two state arrays are reused every step. remember() copies them into memory so overwriting them is safe.
+    state_old = np.empty(11, dtype=np.uint8)
+    state_new = np.empty(11, dtype=np.uint8)
+    while max_games is None or agent.numberofgames < max_games:
         #Calls the get_state method of the agent to retrieve the current game state as a feature vector. This is used as
         #input for the agent's decision-making.
-        state_old = agent.get_state(game)
+        agent.get_state(game, state_old)
 
         #this variable is the next move by the agent based on state_old.
         final_move = agent.get_action(state_old)
 
         #This executes the move in the game and then returns the reward, if the game is done, and the score
         reward, done, score = game.play_step(final_move)
-        state_new = agent.get_state(game)
-
-        #This performs one-step training using the current experience for immediate learning.
-        agent.train_short_memory(state_old, final_move, reward, state_new, done)
+        agent.get_state(game, state_new)
 
         #This stores the expeience in the agent's memory buffer for future training.
         agent.remember(state_old, final_move, reward, state_new, done)
+        #Trains on a minibatch from memory if this move is one the scheduler trains on
+        scheduler.step()
         #This handles if the state is done meaning that the snake has collided and the game is over.
         if done:
             #Train the long memory aka experience replay
             game.reset()
             agent.numberofgames += 1
-            agent.train_long_memory()
+            scheduler.game_over()
 
             if score > record:
                 record = score
-                agent.model.save()
+                checkpoints.save_model(agent.model, agent.MODEL_FILE)
             print('Game', agent.numberofgames, 'Score', score, 'Record', record)
-            #Adds the current game's score to the score list
-            plot_scores.append(score)
             #Updates the cumulative score for mean calc
             total_score += score
             #Calcs the average score over all games played so far
             mean_score = total_score / agent.numberofgames
-            #Stores the mean score for plotting
-            plot_mean_scores.append(mean_score)
-            #Visualizes the scores and mean scores to track the agent's performance over time.
-            plot(plot_scores, plot_mean_scores)
+            #Hands the scores to the background writer so the agent's performance can be tracked over time
+            metrics.log(game=agent.numberofgames, score=score, mean_score=mean_score, record=record,
+                        **scheduler.stats())
+            if agent.numberofgames % checkpoint_every == 0:
+                checkpoints.save(agent, record, total_score, game, scheduler)
+    metrics.close()
+    checkpoints.close()
+    return agent
+
+def train_vectorized(n_games=256, prioritized=False, metrics_path='metrics.jsonl', train_every=TRAIN_EVERY,
+                     step_batch_size=STEP_BATCH_SIZE, updates_per_game=UPDATES_PER_GAME, max_games=None,
+                     target_update=0, tau=None, double=False, tabular=False):
+    #Same training as train() but n_games headless games are played at once in a VecSnakeEnv. Every step picks the
+    #moves for all of them with one forward pass and stores all of their experiences in one write.
+    metrics = MetricsLogger(metrics_path)
+    total_score = 0
+    record = 0
+    agent = make_agent(prioritized, target_update, tau, double, tabular)
+    scheduler = UpdateScheduler(agent, train_every, step_batch_size, updates_per_game)
+    from checkpoint import CheckpointManager
+    checkpoints = CheckpointManager()
+    env = VecSnakeEnv(n_games)
+    states = env.get_states()
+    while max_games is None or agent.numberofgames < max_games:
+        moves = agent.get_actions(states)
+        next_states, rewards, dones = env.step(moves)
+        #One hot actions so the memory holds the same thing remember() stores
+        actions = np.zeros((n_games, 3), dtype=np.int8)
+        actions[np.arange(n_games), moves] = 1
+        agent.memory.extend(states, actions, rewards, next_states, dones)
+        scheduler.step(n_games)
+        states = next_states
+
+        finished = np.flatnonzero(dones)
+        if finished.size:
+            scheduler.game_over(finished.size)
+            for score in env.episode_scores[finished]:
+                agent.numberofgames += 1
+                total_score += int(score)
+                if score > record:
+                    record = int(score)
+                    checkpoints.save_model(agent.model, agent.MODEL_FILE)
+                mean_score = total_score / agent.numberofgames
+                metrics.log(game=agent.numberofgames, score=int(score), mean_score=mean_score, record=record,
+                            **scheduler.stats())
+            print('Game', agent.numberofgames, 'Record', record, 'Mean', round(total_score / agent.numberofgames, 2),
+                  'Steps/s', int(scheduler.stats()['steps_per_second']))
+    metrics.close()
+    checkpoints.close()
+    return agent
+
+def load_policy(model_path):
+    #Returns a function mapping an [N, 11] batch of states to [N, 3] Q-values. A .npz file written by export.py is run
+    #with numpy_qnet and never imports torch. A Q-table saved by TabularAgent (qtable.pth) is played by a QTable, and
+    #anything else is loaded as the state dict Linear_QNet.save writes.
+    if model_path.endswith('.npz'):
+        from numpy_qnet import NumpyQNet
+        return NumpyQNet.load(model_path)
+    import torch
+    state = torch.load(model_path, map_location='cpu')
+    if set(state) == {'q'}:
+        from tabular import QTable
+        table = QTable()
+        table.load_state_dict(state)
+        return table
+    from export import load_model
+    model = load_model(model_path)
+
+    def net(states):
+        with torch.inference_mode():
+            return model(torch.as_tensor(states, dtype=torch.float)).numpy()
+    return net
+
+def evaluate(model_path, n_games=100, parallel=64, seed=None):
+    #Plays n_games greedy headless games with a trained model and returns their scores
+    net = load_policy(model_path)
+    env = VecSnakeEnv(min(parallel, n_games), seed=seed)
+    states = env.get_states()
+    scores = []
+    while len(scores) < n_games:
+        states, _, dones = env.step(np.argmax(net(states), axis=1))
+        scores.extend(int(score) for score in env.episode_scores[dones])
+    return scores[:n_games]
+
 if __name__ == '__main__':
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Train the snake agent')
+    parser.add_argument('--headless', action='store_true', help='run the game without a window or frame rate limit')
+    parser.add_argument('--prioritized', action='store_true', help='use prioritized experience replay')
+    parser.add_argument('--metrics', default='metrics.jsonl', help='file the scores are written to')
+    parser.add_argument('--resume', action='store_true', help='continue from the newest checkpoint')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='games between checkpoints')
+    parser.add_argument('--keep-checkpoints', type=int, default=3, help='how many checkpoints to keep')
+    parser.add_argument('--save-memory', action='store_true', help='include the replay memory in checkpoints')
+    parser.add_argument('--train-every', type=int, default=TRAIN_EVERY, help='moves between minibatch updates')
+    parser.add_argument('--batch-size', type=int, default=STEP_BATCH_SIZE, help='minibatch size for those updates')
+    parser.add_argument('--updates-per-game', type=int, default=UPDATES_PER_GAME,
+                        help='long memory updates when a game ends')
+    parser.add_argument('--target-update', type=int, default=0, metavar='N',
+                        help='use a target network copied from the model every N updates')
+    parser.add_argument('--tau', type=float, default=None,
+                        help='use a target network that follows the model by Polyak averaging with this rate')
+    parser.add_argument('--double', action='store_true', help='use the Double DQN target (needs a target network)')
+    parser.add_argument('--tabular', action='store_true',
+                        help='learn a Q-table over the 2048 states instead of the network')
+    parser.add_argument('--vectorized', type=int, default=0, metavar='N',
+                        help='play N headless games at once with VecSnakeEnv')
+    parser.add_argument('--eval', metavar='PATH',
+                        help='play greedy games with a saved model (.pth or .npz) instead of training')
+    parser.add_argument('--games', type=int, default=100, help='number of games for --eval')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the food positions of the game')
+    args = parser.parse_args()
+    if args.eval:
+        scores = evaluate(args.eval, n_games=args.games)
+        print('Games', len(scores), 'Mean', round(sum(scores) / len(scores), 2), 'Record', max(scores))
+    elif args.vectorized:
+        train_vectorized(n_games=args.vectorized, prioritized=args.prioritized, metrics_path=args.metrics,
+                         train_every=args.train_every, step_batch_size=args.batch_size,
+                         updates_per_game=args.updates_per_game, target_update=args.target_update, tau=args.tau,
+                         double=args.double, tabular=args.tabular)
+    else:
+        train(render=not args.headless, prioritized=args.prioritized, metrics_path=args.metrics, resume=args.resume,
+              checkpoint_every=args.checkpoint_every, keep_checkpoints=args.keep_checkpoints,
+              save_memory=args.save_memory, train_every=args.train_every, step_batch_size=args.batch_size,
+              updates_per_game=args.updates_per_game, target_update=args.target_update, tau=args.tau,
+              double=args.double, tabular=args.tabular, seed=args.seed)
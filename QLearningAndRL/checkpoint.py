@@ -0,0 +1,122 @@
+import copy
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+import torch
+
+
+class CheckpointManager:
+    #CheckpointManager saves everything train() needs to carry on after a restart: the model weights, the Adam state,
+    #the number of games, the record and total score, the random generators and (optionally) the replay memory, the
+    #game's food generator and the update scheduler's counters. With all of those saved a resumed run carries on
+    #exactly where the uninterrupted run would have been.
+    #save() takes a copy of that state on the training thread, which only takes a moment, and a background thread
+    #does the slow part of writing it to disk. Files are written to a temporary name first and then renamed, so a
+    #crash or preemption halfway through a write never leaves a broken checkpoint behind. Only the newest `keep`
+    #checkpoints are kept.
+    def __init__(self, folder='./model/checkpoints', keep=3, save_memory=False):
+        self.folder = folder
+        self.keep = keep
+        self.save_memory = save_memory
+        os.makedirs(self.folder, exist_ok=True)
+        #A single worker keeps the writes in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def save(self, agent, record=0, total_score=0, game=None, scheduler=None):
+        state = {
+            #deepcopy works for both the network's tensors and the Q-table's arrays
+            'model': copy.deepcopy(agent.model.state_dict()),
+            'numberofgames': agent.numberofgames,
+            'record': record,
+            'total_score': total_score,
+            'agent_rng': agent.rng.bit_generator.state,
+            'torch_rng': torch.get_rng_state(),
+        }
+        if agent.trainer.optimizer is not None:
+            state['optimizer'] = copy.deepcopy(agent.trainer.optimizer.state_dict())
+        if agent.trainer.target_model is not None:
+            state['target_model'] = {k: v.detach().clone() for k, v in agent.trainer.target_model.state_dict().items()}
+            state['trainer_updates'] = agent.trainer.updates
+        if self.save_memory:
+            state['memory'] = agent.memory.state_dict()
+        if game is not None:
+            #The food of the game that is about to start was already drawn by reset, so it is saved along with the
+            #generator
+            state['game_rng'] = game.rng.getstate()
+            state['food'] = game.food
+        if scheduler is not None:
+            state['scheduler'] = scheduler.state_dict()
+        path = os.path.join(self.folder, 'checkpoint_%08d.pth' % agent.numberofgames)
+        self._submit(self._write_checkpoint, state, path)
+        return path
+
+    def save_model(self, model, file_name='model.pth'):
+        #Same file Linear_QNet.save writes (./model/model.pth) but written in the background and atomically
+        weights = copy.deepcopy(model.state_dict())
+        self._submit(self._write, weights, os.path.join('./model', file_name))
+
+    def _submit(self, fn, *args):
+        #Forgets about writes that are finished and surfaces the error of any that failed
+        for future in [f for f in self.pending if f.done()]:
+            self.pending.remove(future)
+            future.result()
+        self.pending.append(self.executor.submit(fn, *args))
+
+    def _write(self, obj, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        torch.save(obj, tmp_path)
+        #os.replace is atomic, so readers either see the old file or the complete new one
+        os.replace(tmp_path, path)
+
+    def _write_checkpoint(self, state, path):
+        self._write(state, path)
+        for old in self.checkpoints()[:-self.keep]:
+            os.remove(old)
+
+    def checkpoints(self):
+        #Checkpoint paths from oldest to newest. The zero padded game count makes name order the same as age order.
+        return sorted(glob.glob(os.path.join(self.folder, 'checkpoint_*.pth')))
+
+    def latest(self):
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
+
+    def load(self, agent, path=None, game=None, scheduler=None):
+        #Restores the agent (and the game and scheduler if they were saved) from path or the newest checkpoint and
+        #returns the (record, total_score) it was saved with, or None when there is nothing to resume from
+        path = path or self.latest()
+        if path is None:
+            return None
+        #Checkpoints also hold numpy arrays and generator states, not just tensors, so they are loaded with the full
+        #unpickler. Only load checkpoints this code wrote.
+        state = torch.load(path, weights_only=False)
+        agent.model.load_state_dict(state['model'])
+        if 'optimizer' in state:
+            agent.trainer.optimizer.load_state_dict(state['optimizer'])
+        agent.numberofgames = state['numberofgames']
+        agent.rng.bit_generator.state = state['agent_rng']
+        torch.set_rng_state(state['torch_rng'])
+        if 'target_model' in state and agent.trainer.target_model is not None:
+            agent.trainer.target_model.load_state_dict(state['target_model'])
+            agent.trainer.updates = state['trainer_updates']
+        if 'memory' in state:
+            agent.memory.load_state_dict(state['memory'])
+        if game is not None and 'game_rng' in state:
+            game.rng.setstate(state['game_rng'])
+            game.food = state['food']
+        if scheduler is not None and 'scheduler' in state:
+            scheduler.load_state_dict(state['scheduler'])
+        print('Resumed from', path, 'at game', agent.numberofgames)
+        return state['record'], state['total_score']
+
+    def wait(self):
+        #Blocks until every queued write is on disk
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
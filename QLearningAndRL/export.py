@@ -0,0 +1,59 @@
+import argparse
+import numpy as np
+import torch
+from model import Linear_QNet
+
+
+def load_model(path, input_size=11, hidden_size=256, output_size=3):
+    #Rebuilds a Linear_QNet from the state dict Linear_QNet.save writes
+    model = Linear_QNet(input_size, hidden_size, output_size)
+    model.load_state_dict(torch.load(path, map_location='cpu'))
+    return model.eval()
+
+
+def export_torchscript(model, path):
+    #Scripted models can be loaded with torch.jit.load without this repo's code on the path
+    scripted = torch.jit.script(model.eval())
+    scripted.save(path)
+    return scripted
+
+
+def compile_model(model, **kwargs):
+    #torch.compile fuses the two layers on first call. It is not a file, so it is meant for workers that import torch
+    #anyway and run large batches.
+    return torch.compile(model.eval(), **kwargs)
+
+
+def export_numpy(model, path, dtype='int8'):
+    #Writes the weights for numpy_qnet.NumpyQNet. int8 quantizes every weight row symmetrically with its own scale,
+    #float16 just halves the precision. Biases stay float32 since there are only a few of them.
+    if dtype not in ('int8', 'float16'):
+        raise ValueError('dtype must be int8 or float16, not %r' % dtype)
+    arrays = {'format': np.array(dtype)}
+    for name in ('linear1', 'linear2'):
+        layer = getattr(model, name)
+        weight = layer.weight.detach().cpu().numpy().astype(np.float32)
+        if dtype == 'int8':
+            scale = np.abs(weight).max(axis=1) / 127.0
+            #A row of zeros would divide by zero, any scale works for it
+            scale[scale == 0] = 1.0
+            arrays[name + '.weight'] = np.clip(np.round(weight / scale[:, None]), -127, 127).astype(np.int8)
+            arrays[name + '.scale'] = scale.astype(np.float32)
+        else:
+            arrays[name + '.weight'] = weight.astype(np.float16)
+        arrays[name + '.bias'] = layer.bias.detach().cpu().numpy().astype(np.float32)
+    np.savez(path, **arrays)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a trained Linear_QNet for inference')
+    parser.add_argument('model', nargs='?', default='./model/model.pth', help='state dict written by Linear_QNet.save')
+    parser.add_argument('--torchscript', metavar='PATH', help='write a TorchScript module to PATH')
+    parser.add_argument('--numpy', metavar='PATH', help='write NumPy weights for numpy_qnet.NumpyQNet to PATH')
+    parser.add_argument('--dtype', choices=('int8', 'float16'), default='int8', help='weight format for --numpy')
+    args = parser.parse_args()
+    model = load_model(args.model)
+    if args.torchscript:
+        export_torchscript(model, args.torchscript)
+    if args.numpy:
+        export_numpy(model, args.numpy, args.dtype)
@@ -1,9 +1,51 @@
-import matplotlib.pyplot as plt
-from IPython import display
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+
+class MetricsLogger:
+    #MetricsLogger appends one JSON line per call to a metrics file. The writing happens on a background thread, so
+    #log() only puts the numbers on a queue and returns straight away; training never waits on the disk or a plot.
+    #The file can be watched while training runs with: python helper.py metrics.jsonl
+    def __init__(self, path='metrics.jsonl'):
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def log(self, **metrics):
+        metrics.setdefault('time', time.time())
+        self.queue.put(metrics)
+
+    def _write(self):
+        with open(self.path, 'a') as f:
+            while True:
+                item = self.queue.get()
+                #Writes everything that queued up in the meantime before flushing once
+                while item is not None:
+                    f.write(json.dumps(item) + '\n')
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                f.flush()
+                if item is None:
+                    return
+
+    def close(self):
+        #Writes whatever is still queued and stops the writer thread
+        self.queue.put(None)
+        self.thread.join()
 
-plt.ion()
 
 def plot(scores, mean_scores):
+    import matplotlib.pyplot as plt
+    from IPython import display
+
+    plt.ion()
     #This clears the previous ouput in the notebook to prep for updated plot
     display.clear_output(wait=True)
     #This then displays the current figure
@@ -22,4 +64,64 @@ def plot(scores, mean_scores):
     plt.text(len(mean_scores)-1, mean_scores[-1], str(mean_scores[-1]))
     plt.show(block=False)
     #Pauses to allow for the plot to render correctly
-    plt.pause(.1)
\ No newline at end of file
+    plt.pause(.1)
+
+
+def view(path='metrics.jsonl', interval=1.0):
+    #Live plot of a metrics file written by MetricsLogger, meant to run in its own process next to training. It keeps
+    #its place in the file and only parses the lines added since the last refresh.
+    import matplotlib.pyplot as plt
+
+    scores = []
+    mean_scores = []
+    fig, ax = plt.subplots()
+    ax.set_title('SnakeAI Data')
+    ax.set_xlabel('# of Games')
+    ax.set_ylabel('Score')
+    score_line, = ax.plot([], [])
+    mean_line, = ax.plot([], [])
+    score_text = ax.text(0, 0, '')
+    mean_text = ax.text(0, 0, '')
+    plt.show(block=False)
+
+    #Waits for training to create the file
+    while not os.path.exists(path):
+        plt.pause(interval)
+
+    partial = ''
+    with open(path) as f:
+        while plt.fignum_exists(fig.number):
+            new = f.read()
+            if new:
+                #The last line might still be half written so it is kept until the rest of it shows up
+                lines = (partial + new).split('\n')
+                partial = lines.pop()
+                for line in lines:
+                    if not line:
+                        continue
+                    metrics = json.loads(line)
+                    if 'score' in metrics:
+                        scores.append(metrics['score'])
+                        mean_scores.append(metrics.get('mean_score', sum(scores) / len(scores)))
+                if scores:
+                    games = range(len(scores))
+                    score_line.set_data(games, scores)
+                    mean_line.set_data(games, mean_scores)
+                    #Places a text annotation at last point of the scores plot
+                    score_text.set_position((len(scores) - 1, scores[-1]))
+                    score_text.set_text(str(scores[-1]))
+                    mean_text.set_position((len(mean_scores) - 1, mean_scores[-1]))
+                    mean_text.set_text(str(round(mean_scores[-1], 2)))
+                    ax.relim()
+                    ax.autoscale_view()
+                    ax.set_ylim(bottom=0)
+                    fig.canvas.draw_idle()
+            plt.pause(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Live plot of the metrics written during training')
+    parser.add_argument('path', nargs='?', default='metrics.jsonl', help='metrics file to watch')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between refreshes')
+    args = parser.parse_args()
+    view(args.path, args.interval)
@@ -0,0 +1,199 @@
+import numpy as np
+import torch
+
+
+class ReplayBuffer:
+    #ReplayBuffer stores experiences in fixed size NumPy arrays instead of a deque of tuples. Every field has its own
+    #array with the smallest dtype that fits (the 11 state features and the one hot actions are only 0s and 1s), so
+    #100k experiences take a few MB and appending or sampling never has to walk a Python container.
+    def __init__(self, capacity, state_size=11, action_size=3, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.uint8)
+        self.actions = np.zeros((capacity, action_size), dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.uint8)
+        self.dones = np.zeros(capacity, dtype=bool)
+        #Torch views that share memory with the arrays above so sampling can index straight into them
+        self._states_t = torch.from_numpy(self.states)
+        self._actions_t = torch.from_numpy(self.actions)
+        self._rewards_t = torch.from_numpy(self.rewards)
+        self._next_states_t = torch.from_numpy(self.next_states)
+        self._dones_t = torch.from_numpy(self.dones)
+        #position is the slot the next experience is written to. Once the buffer is full it wraps around and
+        #overwrites the oldest experience just like deque(maxlen=capacity) would.
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+        #Pinned memory lets batches be copied to a GPU asynchronously. It only exists when there is a GPU to copy to.
+        self.pin_memory = torch.cuda.is_available()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state, done):
+        #Stores a single experience in O(1)
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        #Stores a whole batch of experiences (for example one step of VecSnakeEnv) with one write per field
+        n = len(rewards)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample_indices(self, batch_size):
+        #Uniform random rows. Until the buffer holds more than batch_size experiences every stored one is used.
+        if self.size > batch_size:
+            return self.rng.integers(0, self.size, size=batch_size)
+        return np.arange(self.size)
+
+    def gather(self, idx):
+        #Turns a set of row indices into the (states, actions, rewards, next_states, dones) tensors QTrainer expects
+        idx = torch.from_numpy(np.asarray(idx, dtype=np.int64))
+        batch = (self._states_t[idx].float(),
+                 self._actions_t[idx].long(),
+                 self._rewards_t[idx],
+                 self._next_states_t[idx].float(),
+                 self._dones_t[idx])
+        if self.pin_memory:
+            batch = tuple(t.pin_memory() for t in batch)
+        return batch
+
+    def sample(self, batch_size):
+        #Sampling cost only depends on batch_size, not on how many experiences are stored
+        return self.gather(self.sample_indices(batch_size))
+
+    def state_dict(self):
+        #A copy of everything needed to rebuild the buffer exactly, used by CheckpointManager
+        return {'states': self.states.copy(), 'actions': self.actions.copy(), 'rewards': self.rewards.copy(),
+                'next_states': self.next_states.copy(), 'dones': self.dones.copy(),
+                'position': self.position, 'size': self.size, 'rng': self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        #Arrays are copied in place so the torch views made in __init__ keep pointing at the data
+        self.states[:] = state['states']
+        self.actions[:] = state['actions']
+        self.rewards[:] = state['rewards']
+        self.next_states[:] = state['next_states']
+        self.dones[:] = state['dones']
+        self.position = state['position']
+        self.size = state['size']
+        self.rng.bit_generator.state = state['rng']
+
+
+class SumTree:
+    #SumTree is a binary tree stored in a flat array where every parent holds the sum of its two children and the
+    #leaves hold the priorities. tree[1] is the total, and finding the leaf a random number falls on or changing a
+    #priority only walks one path from the root, so both are O(log n). Every method works on whole arrays of indices
+    #at once so a batch of 10k lookups is still only log n NumPy operations.
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.leaves]
+
+    def update(self, idx, priorities):
+        #Writes the new leaf values and then recomputes every parent on the way up from the changed leaves
+        nodes = np.asarray(idx, dtype=np.int64) + self.leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        #Returns the leaf index for every value in [0, total). Leaf i is hit with probability priority_i / total.
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    #Prioritized experience replay. Experiences are sampled with probability proportional to priority ** alpha where
+    #the priority is the size of their last TD error, so rare, surprising experiences (like dying) are replayed much
+    #more often than in uniform sampling. Because that biases the updates every sample also gets an importance
+    #sampling weight; beta controls how much of the bias is corrected and is annealed towards 1 over training.
+    def __init__(self, capacity, state_size=11, action_size=3, seed=None, alpha=0.6, beta=0.4,
+                 beta_increment=0.001, epsilon=1e-5):
+        super().__init__(capacity, state_size, action_size, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        #epsilon keeps experiences with a TD error of 0 from never being picked again
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        #New experiences get the highest priority seen so far so each one is replayed at least once
+        self.max_priority = 1.0
+
+    def append(self, state, action, reward, next_state, done):
+        i = self.position
+        super().append(state, action, reward, next_state, done)
+        self.tree.update([i], self.max_priority)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        idx = (self.position + np.arange(len(rewards))) % self.capacity
+        super().extend(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority)
+
+    def sample_indices(self, batch_size):
+        #The total priority is split into batch_size equal segments and one value is drawn from each, which spreads
+        #the batch over the whole buffer instead of letting it bunch up on the top few priorities.
+        n = min(batch_size, self.size)
+        segment = self.tree.total() / n
+        values = (np.arange(n) + self.rng.random(n)) * segment
+        #Rounding can push a value past the last non empty leaf so indices are clamped into the filled part
+        return np.minimum(self.tree.find(values), self.size - 1)
+
+    def sample(self, batch_size):
+        #Returns the usual five tensors plus the importance sampling weights for the loss and the row indices that
+        #update_priorities needs once the new TD errors are known
+        idx = self.sample_indices(batch_size)
+        probabilities = self.tree.get(idx) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        weights = torch.from_numpy(weights.astype(np.float32))
+        if self.pin_memory:
+            weights = weights.pin_memory()
+        return self.gather(idx) + (weights, idx)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update(tree=self.tree.tree.copy(), max_priority=self.max_priority, beta=self.beta)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree[:] = state['tree']
+        self.max_priority = state['max_priority']
+        self.beta = state['beta']
+
+    def update_priorities(self, idx, td_errors):
+        if isinstance(td_errors, torch.Tensor):
+            td_errors = td_errors.detach().cpu().numpy()
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities)
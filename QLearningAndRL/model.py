@@ -4,6 +4,7 @@ import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 import os
+import copy
 
 class Linear_QNet(nn.Module):
     #Initialize the network structure
@@ -37,19 +38,44 @@ class Linear_QNet(nn.Module):
         #Saves models parameters to the specified file.
         torch.save(self.state_dict(), file_name)
 
+def as_tensor(x, dtype):
+    #Batches from the ReplayBuffer are already tensors and only need their dtype checked. Anything else (lists, tuples
+    #of arrays, single numbers) is stacked with numpy first.
+    if isinstance(x, torch.Tensor):
+        return x.to(dtype)
+    return torch.tensor(np.array(x), dtype=dtype)
+
 class QTrainer:
-    def __init__(self, model, lr, gamma):
+    #target_update > 0 keeps a frozen copy of the model (the target network) that the Bellman targets are computed with
+    #and copies the model into it every target_update updates. tau instead blends the model into the target network
+    #a little after every update (target = tau * model + (1 - tau) * target). double=True uses the Double DQN rule:
+    #the model picks the best next action and the target network says how good it is, which needs one of the two.
+    def __init__(self, model, lr, gamma, target_update=0, tau=None, double=False):
         self.lr = lr
         self.gamma = gamma
         self.model = model
         self.optimizer = optim.Adam(model.parameters(), lr = self.lr)
         self.criterion = nn.MSELoss()
+        self.target_update = target_update
+        self.tau = tau
+        self.double = double
+        #Counts optimizer steps for the hard target sync
+        self.updates = 0
+        self.target_model = None
+        if self.target_update or self.tau is not None:
+            self.target_model = copy.deepcopy(model)
+            self.target_model.requires_grad_(False)
+        elif self.double:
+            raise ValueError('double=True needs a target network, set target_update or tau')
 
-    def train_step(self, state, action, reward, next_state, done):
-        state = torch.tensor(np.array(state), dtype=torch.float)
-        next_state = torch.tensor(np.array(next_state), dtype=torch.float)
-        action = torch.tensor(np.array(action), dtype=torch.long)
-        reward = torch.tensor(np.array(reward), dtype=torch.float)
+    #weights are optional per row importance sampling weights from a PrioritizedReplayBuffer. train_step returns the
+    #TD error of every row so the buffer can update its priorities.
+    def train_step(self, state, action, reward, next_state, done, weights=None):
+        state = as_tensor(state, torch.float)
+        next_state = as_tensor(next_state, torch.float)
+        action = as_tensor(action, torch.long)
+        reward = as_tensor(reward, torch.float)
+        done = as_tensor(done, torch.bool)
         #Checks that the input is a single experience and not a batch
         if len(state.shape) == 1:
             #Adds batch dimension to ensure compatibility witht he model
@@ -57,26 +83,49 @@ class QTrainer:
             next_state = torch.unsqueeze(next_state, 0)
             action = torch.unsqueeze(action, 0)
             reward = torch.unsqueeze(reward, 0)
-            done = (done, )
+            done = torch.unsqueeze(done, 0)
         #Predicts the Q-values for the current state
         pred = self.model(state)
+        #The best Q-value of every next state comes from one forward pass over the whole batch. It is only a target so
+        #no gradients are tracked for it.
+        with torch.no_grad():
+            bootstrap_model = self.target_model if self.target_model is not None else self.model
+            if self.double:
+                next_action = self.model(next_state).argmax(dim=1, keepdim=True)
+                next_q = bootstrap_model(next_state).gather(1, next_action).squeeze(1)
+            else:
+                next_q = bootstrap_model(next_state).max(dim=1).values
+        #Bellman equation for every row at once. Rows where the episode is over only keep their reward.
+        Q_new = reward + self.gamma * next_q * ~done
         #Creates a copy of pred to be modified as the training target
-        target = pred.clone()
-        #Iterates through all experiences in the batch
-        for idx in range(len(done)):
-
-            Q_new = reward[idx]
-            #Updates Q-value using the Bellman equation if the episode is not over
-            if not done[idx]:
-                Q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-            #Updates the Q-value for the specific action taken
-            target[idx][torch.argmax(action).item()] = Q_new
+        target = pred.detach().clone()
+        #Updates the Q-value for the action taken in each row (the index of the 1 in that row's one hot action)
+        action_idx = torch.argmax(action, dim=1, keepdim=True)
+        target.scatter_(1, action_idx, Q_new.unsqueeze(1))
         #Clears previous gradients to prevent accumulation
         self.optimizer.zero_grad()
         #Computes the loss between predicted and target Q-values
-        loss = self.criterion(target, pred)
+        if weights is None:
+            loss = self.criterion(target, pred)
+        else:
+            #Same mean squared error but every row is scaled by its importance sampling weight
+            loss = (as_tensor(weights, torch.float) * ((target - pred) ** 2).mean(dim=1)).mean()
         #Calculates gradiets for each model parameter
         loss.backward()
 
         self.optimizer.step()
+        self.updates += 1
+        self._sync_target()
+        return (Q_new - pred.detach().gather(1, action_idx).squeeze(1))
+
+    def _sync_target(self):
+        if self.target_model is None:
+            return
+        with torch.no_grad():
+            if self.tau is not None:
+                #Polyak averaging: move every target weight a fraction tau of the way towards the model's
+                for target_param, param in zip(self.target_model.parameters(), self.model.parameters()):
+                    target_param.lerp_(param, self.tau)
+            elif self.updates % self.target_update == 0:
+                self.target_model.load_state_dict(self.model.state_dict())
 
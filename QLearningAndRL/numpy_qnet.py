@@ -0,0 +1,46 @@
+import numpy as np
+
+#Files written by export.export_numpy hold linear1/linear2 weights and biases. int8 files store every weight row as
+#int8 values plus one float32 scale per row (weight = int8 value * scale), float16 files store the weights as float16.
+#Biases are always float32.
+LAYERS = ('linear1', 'linear2')
+
+
+class NumpyQNet:
+    #Linear_QNet.forward in plain NumPy, for inference workers that only need the moves and should not pay for
+    #importing torch. The weights are turned back into float32 once when the file is loaded, the network is only a
+    #few thousand numbers so that costs nothing and keeps forward() two matrix products.
+    def __init__(self, weights, biases):
+        self.weights = weights
+        self.biases = biases
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fmt = str(data['format'])
+            weights = []
+            biases = []
+            for name in LAYERS:
+                weight = data[name + '.weight']
+                if fmt == 'int8':
+                    weight = weight.astype(np.float32) * data[name + '.scale'][:, None]
+                elif fmt != 'float16':
+                    raise ValueError('Unknown weight format %r in %s' % (fmt, path))
+                #Stored as [out, in] like nn.Linear, transposed here so forward is x @ weight
+                weights.append(np.ascontiguousarray(weight.astype(np.float32).T))
+                biases.append(data[name + '.bias'].astype(np.float32))
+        return cls(weights, biases)
+
+    def forward(self, x):
+        #x is one state of 11 features or a batch [N, 11]. Returns the Q-values of the 3 moves.
+        x = np.asarray(x, dtype=np.float32)
+        x = np.maximum(x @ self.weights[0] + self.biases[0], 0.0)
+        return x @ self.weights[1] + self.biases[1]
+
+    __call__ = forward
+
+    def get_action(self, state):
+        #Greedy move as the one hot list Agent.get_action and play_step use
+        final_move = [0, 0, 0]
+        final_move[int(np.argmax(self.forward(state)))] = 1
+        return final_move
@@ -0,0 +1,89 @@
+import time
+
+#Defaults: a small minibatch from memory every 4 environment steps and one long memory update at the end of a game
+TRAIN_EVERY = 4
+STEP_BATCH_SIZE = 64
+UPDATES_PER_GAME = 1
+
+
+class UpdateScheduler:
+    #UpdateScheduler decides when the agent trains and on how much data, instead of the fixed "one update on the last
+    #move every step + one big replay update per game" split. Every train_every environment steps it runs one update
+    #on a step_batch_size minibatch sampled from memory, and every time a game ends it runs updates_per_game updates
+    #on game_batch_size experiences (the agent's usual long memory BATCH_SIZE when left as None). Setting
+    #train_every=0 or updates_per_game=0 turns that kind of update off. It also counts environment steps and gradient
+    #updates so the split between playing and learning can be tuned.
+    def __init__(self, agent, train_every=TRAIN_EVERY, step_batch_size=STEP_BATCH_SIZE,
+                 updates_per_game=UPDATES_PER_GAME, game_batch_size=None, warmup=0):
+        self.agent = agent
+        self.train_every = train_every
+        self.step_batch_size = step_batch_size
+        self.updates_per_game = updates_per_game
+        self.game_batch_size = game_batch_size
+        #No step updates happen until memory holds at least warmup experiences
+        self.warmup = warmup
+        self.steps = 0
+        self.updates = 0
+        #Updates the schedule asked for but a max_updates cap skipped
+        self.dropped = 0
+        self._steps_since_update = 0
+        #The rates in stats() only count what happened since start_time, which is not the whole run after a resume
+        self.start_time = time.time()
+        self._start_steps = 0
+        self._start_updates = 0
+
+    def step(self, n_steps=1, max_updates=None):
+        #Call after n_steps new experiences were remembered (n_steps is the batch size when stepping many games at
+        #once). Returns the number of updates that were run. With max_updates at most that many are run and the steps
+        #they were owed for are dropped, so a learner that falls behind trains less per step instead of piling up work.
+        self.steps += n_steps
+        if not self.train_every or len(self.agent.memory) < max(self.warmup, 1):
+            return 0
+        self._steps_since_update += n_steps
+        n_updates = self._steps_since_update // self.train_every
+        self._steps_since_update -= n_updates * self.train_every
+        if max_updates is not None and n_updates > max_updates:
+            self.dropped += n_updates - max_updates
+            n_updates = max_updates
+        for _ in range(n_updates):
+            self.agent.train_batch(self.step_batch_size)
+        self.updates += n_updates
+        return n_updates
+
+    def game_over(self, n_games=1, max_updates=None):
+        #Call once games have finished. Returns the number of updates that were run, at most max_updates if given.
+        n_updates = self.updates_per_game * n_games
+        if max_updates is not None and n_updates > max_updates:
+            self.dropped += n_updates - max_updates
+            n_updates = max_updates
+        for _ in range(n_updates):
+            if self.game_batch_size is None:
+                self.agent.train_long_memory()
+            else:
+                self.agent.train_batch(self.game_batch_size)
+        self.updates += n_updates
+        return n_updates
+
+    def state_dict(self):
+        #The counters that decide when the next updates happen, so a resumed run trains on the same moves
+        return {'steps': self.steps, 'updates': self.updates, 'dropped': self.dropped,
+                'steps_since_update': self._steps_since_update}
+
+    def load_state_dict(self, state):
+        self.steps = state['steps']
+        self.updates = state['updates']
+        self.dropped = state.get('dropped', 0)
+        self._steps_since_update = state['steps_since_update']
+        #The restored totals happened before this process started, so the rates count from here
+        self.start_time = time.time()
+        self._start_steps = self.steps
+        self._start_updates = self.updates
+
+    def stats(self):
+        #Total environment steps and gradient updates, how many updates were dropped by max_updates caps, the updates
+        #per step that were actually run, and steps and updates per second since the scheduler was created or loaded
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return {'steps': self.steps, 'updates': self.updates, 'dropped_updates': self.dropped,
+                'updates_per_step': self.updates / max(self.steps, 1),
+                'steps_per_second': (self.steps - self._start_steps) / elapsed,
+                'updates_per_second': (self.updates - self._start_updates) / elapsed}
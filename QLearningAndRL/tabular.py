@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+from agent import Agent
+
+#A table entry only ever sees its own experiences, so it can take much bigger steps than the network's Adam LR
+TABULAR_LR = 0.1
+
+
+class QTable:
+    #The 11 state features are all 0 or 1, so there are only 2048 states and the whole Q-function fits in a dense
+    #[2048, 3] table. QTable stands in for both Linear_QNet and QTrainer: calling it gives the Q-values of a batch of
+    #states and train_step takes the same arguments as QTrainer.train_step. A batch is one vectorized Q-learning
+    #update where experiences that hit the same (state, move) entry are averaged, so a big batch does not overshoot.
+    def __init__(self, n_features=11, n_actions=3, lr=TABULAR_LR, gamma=0.9):
+        self.lr = lr
+        self.gamma = gamma
+        self.n_actions = n_actions
+        self.q = np.zeros((1 << n_features, n_actions), dtype=np.float64)
+        #Feature i is bit i of the row index
+        self.bits = 1 << np.arange(n_features, dtype=np.int64)
+        #No optimizer state or target network to checkpoint
+        self.optimizer = None
+        self.target_model = None
+
+    def index(self, states):
+        #Row of every state in a single state or a [N, 11] batch (arrays, lists or CPU tensors all work)
+        return np.atleast_2d(np.asarray(states)).astype(np.int64) @ self.bits
+
+    def __call__(self, states):
+        return self.q[self.index(states)]
+
+    def train_step(self, state, action, reward, next_state, done, weights=None):
+        rows = self.index(state)
+        next_rows = self.index(next_state)
+        moves = np.atleast_2d(np.asarray(action)).argmax(axis=1)
+        reward = np.atleast_1d(np.asarray(reward, dtype=np.float64))
+        done = np.atleast_1d(np.asarray(done, dtype=bool))
+        Q_new = reward + self.gamma * self.q[next_rows].max(axis=1) * ~done
+        td_errors = Q_new - self.q[rows, moves]
+        step = td_errors if weights is None else td_errors * np.asarray(weights, dtype=np.float64)
+        entries = rows * self.n_actions + moves
+        counts = np.bincount(entries, minlength=self.q.size)
+        totals = np.bincount(entries, weights=step, minlength=self.q.size)
+        hit = np.flatnonzero(counts)
+        self.q.ravel()[hit] += self.lr * totals[hit] / counts[hit]
+        #Same return value as QTrainer.train_step so prioritized replay works unchanged
+        return td_errors
+
+    def state_dict(self):
+        #The table is saved as a tensor so qtable.pth loads with torch.load's default weights_only=True like model.pth
+        return {'q': torch.from_numpy(self.q.copy())}
+
+    def load_state_dict(self, state):
+        self.q[:] = np.asarray(state['q'])
+
+
+class TabularAgent(Agent):
+    #Agent with the network swapped for a QTable. State features, memory, exploration and the training loops are all
+    #the inherited ones, only the Q-values come from the table.
+    MODEL_FILE = 'qtable.pth'
+
+    def __init__(self, prioritized=False, lr=TABULAR_LR):
+        self._setup_memory_and_exploration(prioritized)
+        self.model = QTable(lr=lr, gamma=self.gamma)
+        #The table trains itself
+        self.trainer = self.model
+
+    def predict_moves(self, states):
+        return self.model(states).argmax(axis=1)
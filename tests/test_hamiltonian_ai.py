@@ -0,0 +1,53 @@
+import importlib.util
+import os
+
+import pytest
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+hamiltonian = load('SnakeGameHamiltonianPath', 'HamiltonianPathOnlyKindOfBoring/SnakeGameHamiltonianPath.py')
+astar = load('AStarAndHamiltonianAlgorithm', 'A*AndHamiltonian/A*andHamiltonianAlgorithm.py.py')
+
+# Boards in pixels with an even number of rows and columns. Half of them have an odd number of rows // 2, where the
+# head starts on a row the serpentine cycle runs leftwards along, straight into the neck.
+BOARDS = [(120, 120), (200, 200), (160, 240), (640, 200), (640, 440), (640, 480)]
+
+
+def play(game, next_direction):
+    # Plays until the game ends and returns the number of moves
+    moves = 0
+    game_over = False
+    while not game_over:
+        game.direction = next_direction()
+        game_over, _ = game.play_step()
+        moves += 1
+    return moves
+
+
+@pytest.mark.parametrize('w, h', BOARDS)
+def test_safe_hamiltonian_ai_fills_board(w, h):
+    for seed in range(2):
+        game = hamiltonian.SnakeGame(w, h, seed=seed, render=False)
+        ai = hamiltonian.SafeHamiltonianAI(game)
+        play(game, ai.get_next_move)
+        # play_step ends the game with no food left once the snake covers every cell
+        assert game.food is None
+
+
+@pytest.mark.parametrize('w, h', BOARDS)
+def test_improved_ai_cycle_fills_board(w, h):
+    # ImprovedAI falls back to the same cycle, so following nothing but the cycle has to fill the board too
+    game = astar.SnakeGame(w, h, seed=0, render=False)
+    ai = astar.ImprovedAI(game)
+    play(game, lambda: ai.get_direction(game.snake[0], ai.next_cell(game.snake[0])))
+    assert game.food is None
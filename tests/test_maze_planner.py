@@ -0,0 +1,85 @@
+import importlib.util
+import os
+
+import pytest
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+GAME_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'OMG_IT_FINALLY_WORKS',
+                         'AlteredHamiltonianPathSnakeGame.py')
+spec = importlib.util.spec_from_file_location('AlteredHamiltonianPathSnakeGame', GAME_FILE)
+game_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(game_module)
+
+SnakeGame = game_module.SnakeGame
+Direction = game_module.Direction
+BLOCK_SIZE = game_module.BLOCK_SIZE
+
+# Boards in pixels, all with an even number of cells each way like the maze needs
+BOARDS = [(120, 120), (200, 160), (320, 240), (640, 480)]
+
+
+def reference_is_valid_move(game, x, y):
+    if x < 0 or y < 0 or x >= game.cols or y >= game.rows:
+        return False
+    return not game.occupancy[y * game.cols + x]
+
+
+def reference_direction(game):
+    # _ai_get_new_direction before the flat tour and neighbour tables, built on Maze.get_path_number and
+    # Maze.path_distance
+    x = game.head.x // BLOCK_SIZE
+    y = game.head.y // BLOCK_SIZE
+    path_number = game.maze.get_path_number(x, y)
+    distance_to_food = game.maze.path_distance(path_number, game.maze.get_path_number(game.food.x // BLOCK_SIZE,
+                                                                                      game.food.y // BLOCK_SIZE))
+    distance_to_tail = game.maze.path_distance(path_number,
+                                               game.maze.get_path_number(game.snake[-1].x // BLOCK_SIZE,
+                                                                         game.snake[-1].y // BLOCK_SIZE))
+
+    cutting_amount_available = distance_to_tail - len(game.snake) - 3
+    num_empty_squares = game.maze.size - len(game.snake) - 1
+
+    if num_empty_squares < game.maze.size // 2:
+        cutting_amount_available = 0
+    elif distance_to_food < distance_to_tail:
+        cutting_amount_available -= 1
+        if (distance_to_tail - distance_to_food) * 4 > num_empty_squares:
+            cutting_amount_available -= 10
+
+    cutting_amount_desired = distance_to_food
+    cutting_amount_available = min(cutting_amount_available, cutting_amount_desired)
+    cutting_amount_available = max(cutting_amount_available, 0)
+
+    best_dir = None
+    best_dist = -1
+    for direction in [Direction.RIGHT, Direction.LEFT, Direction.DOWN, Direction.UP]:
+        new_x, new_y = x, y
+        if direction == Direction.RIGHT:
+            new_x += 1
+        elif direction == Direction.LEFT:
+            new_x -= 1
+        elif direction == Direction.DOWN:
+            new_y += 1
+        elif direction == Direction.UP:
+            new_y -= 1
+
+        if reference_is_valid_move(game, new_x, new_y):
+            dist = game.maze.path_distance(path_number, game.maze.get_path_number(new_x, new_y))
+            if dist <= cutting_amount_available and dist > best_dist:
+                best_dir = direction
+                best_dist = dist
+
+    return best_dir if best_dir else Direction.RIGHT
+
+
+@pytest.mark.parametrize('w, h', BOARDS)
+def test_planner_matches_reference(w, h):
+    # Every decision of whole seeded games, from the first move until the board is full or the snake dies
+    seeds = range(3) if w * h > 100_000 else range(10)
+    for seed in seeds:
+        game = SnakeGame(w, h, seed=seed, render=False)
+        game_over = False
+        while not game_over:
+            assert game._ai_get_new_direction() == reference_direction(game)
+            game_over, _ = game.play_step()
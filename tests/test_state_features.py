@@ -0,0 +1,144 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'QLearningAndRL'))
+
+from SnakeGame import SnakeGameAI, VecSnakeEnv, Direction, Point, BLOCK_SIZE  # noqa: E402
+from agent import Agent, CLOCK_WISE_INDEX  # noqa: E402
+
+# Boards in pixels. The head starts at (w / 2, h / 2), so both sides are multiples of two cells.
+BOARDS = [(160, 160), (240, 160), (640, 480)]
+
+
+def reference_is_collision(game, pt):
+    # SnakeGameAI.is_collision before the occupancy grid: bounds plus a scan of the body
+    if pt.x > game.w - BLOCK_SIZE or pt.x < 0 or pt.y > game.h - BLOCK_SIZE or pt.y < 0:
+        return True
+    return pt in list(game.snake)[1:]
+
+
+def reference_get_state(game):
+    # Agent.get_state before it read the occupancy grid, kept as the definition of the 11 features
+    head = game.snake[0]
+    point_l = Point(head.x - 20, head.y)
+    point_r = Point(head.x + 20, head.y)
+    point_u = Point(head.x, head.y - 20)
+    point_d = Point(head.x, head.y + 20)
+    dir_l = game.direction == Direction.LEFT
+    dir_r = game.direction == Direction.RIGHT
+    dir_u = game.direction == Direction.UP
+    dir_d = game.direction == Direction.DOWN
+    # The old version had no food once the board was full, the new one then compares the head with itself
+    food = game.food if game.food is not None else game.head
+
+    state = [
+        (dir_r and reference_is_collision(game, point_r)) or
+        (dir_l and reference_is_collision(game, point_l)) or
+        (dir_u and reference_is_collision(game, point_u)) or
+        (dir_d and reference_is_collision(game, point_d)),
+
+        (dir_u and reference_is_collision(game, point_r)) or
+        (dir_d and reference_is_collision(game, point_l)) or
+        (dir_l and reference_is_collision(game, point_u)) or
+        (dir_r and reference_is_collision(game, point_d)),
+
+        (dir_d and reference_is_collision(game, point_r)) or
+        (dir_u and reference_is_collision(game, point_l)) or
+        (dir_r and reference_is_collision(game, point_u)) or
+        (dir_l and reference_is_collision(game, point_d)),
+
+        dir_l,
+        dir_r,
+        dir_u,
+        dir_d,
+
+        food.x < game.head.x,
+        food.x > game.head.x,
+        food.y < game.head.y,
+        food.y > game.head.y
+    ]
+    return np.array(state, dtype=int)
+
+
+def choose_move(state, rng):
+    # Random safe move, heading for the food half of the time so the snakes get long
+    safe = [move for move in range(3) if not state[move]]
+    if not safe:
+        return rng.integers(0, 3)
+    if rng.random() < 0.5:
+        facing = [Direction.LEFT, Direction.RIGHT, Direction.UP, Direction.DOWN][int(np.argmax(state[3:7]))]
+        d = CLOCK_WISE_INDEX[facing]
+        # Absolute direction each move would take and whether the food lies that way
+        towards = {0: state[8], 1: state[10], 2: state[7], 3: state[9]}
+        good = [move for move in safe if towards[(d + (0, 1, -1)[move]) % 4]]
+        if good:
+            return good[0]
+    return safe[rng.integers(0, len(safe))]
+
+
+def copy_into_env(env, i, game):
+    # Writes a SnakeGameAI position into row i of a VecSnakeEnv
+    cells = [game.cell_index(pt) for pt in reversed(game.snake)]
+    env.grid[i] = False
+    env.grid[i, cells] = True
+    env.body[i, :len(cells)] = cells
+    env.head_ptr[i] = len(cells) - 1
+    env.length[i] = len(cells)
+    env.direction[i] = CLOCK_WISE_INDEX[game.direction]
+    env.food[i] = game.cell_index(game.food) if game.food is not None else -1
+
+
+def play(w, h, seed, n_moves):
+    # Yields the game after every move of seeded games, including the crashed positions right before reset
+    game = SnakeGameAI(w, h, render=False, seed=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(n_moves):
+        action = [0, 0, 0]
+        action[choose_move(reference_get_state(game), rng)] = 1
+        _, done, _ = game.play_step(action)
+        yield game, done
+        if done:
+            game.reset()
+
+
+@pytest.mark.parametrize('w, h', BOARDS)
+def test_get_state_matches_reference(w, h):
+    crashes = 0
+    longest = 0
+    for seed in range(5):
+        for game, done in play(w, h, seed, 4000):
+            expected = reference_get_state(game)
+            assert np.array_equal(Agent.get_state(game), expected)
+            out = np.empty(11, dtype=np.uint8)
+            Agent.get_state(game, out)
+            assert np.array_equal(out, expected)
+            crashes += done
+            longest = max(longest, len(game.snake))
+    # Make sure the games covered what the grid version has to special case
+    assert crashes > 0
+    assert longest >= 15
+
+
+@pytest.mark.parametrize('w, h', BOARDS)
+def test_batched_states_match_reference(w, h):
+    n_games = 16
+    agent = Agent()
+    games = [SnakeGameAI(w, h, render=False, seed=seed) for seed in range(n_games)]
+    rngs = [np.random.default_rng(seed) for seed in range(n_games)]
+    env = VecSnakeEnv(n_games, w, h)
+    for _ in range(1500):
+        for game, rng in zip(games, rngs):
+            action = [0, 0, 0]
+            action[choose_move(reference_get_state(game), rng)] = 1
+            _, done, _ = game.play_step(action)
+            if done:
+                game.reset()
+        expected = np.array([reference_get_state(game) for game in games])
+        assert np.array_equal(agent.get_states(games), expected)
+        # VecSnakeEnv resets crashed games inside step, so it is only compared on positions that are still playing
+        for i, game in enumerate(games):
+            copy_into_env(env, i, game)
+        assert np.array_equal(env.get_states(), expected)
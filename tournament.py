@@ -0,0 +1,204 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Strategy name -> (game file, AI class). The maze game picks its own moves inside play_step so it has no AI class.
+# 'rl' plays a trained QLearningAndRL model and is only available with --model.
+STRATEGIES = {
+    'astar': ('A*AndHamiltonian/A*andHamiltonianAlgorithm.py.py', 'ImprovedAI'),
+    'hamiltonian': ('HamiltonianPathOnlyKindOfBoring/SnakeGameHamiltonianPath.py', 'SafeHamiltonianAI'),
+    'maze': ('OMG_IT_FINALLY_WORKS/AlteredHamiltonianPathSnakeGame.py', None),
+    'rl': None,
+}
+
+# Per-move latencies are counted in log-spaced bins from 100 ns to 10 s (about 5% wide each), so a worker only sends
+# a few hundred counts back per game however long the game was, and percentiles are read off the merged counts
+LATENCY_BINS_NS = np.logspace(2, 10, 401)
+
+# Modules and models each worker process has loaded so far
+_modules = {}
+_policies = {}
+
+
+def _init_worker():
+    # Workers never open a window, and the games' prints ("Using A*", "Found a Wall", ...) would flood the terminal
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    sys.path.insert(0, os.path.join(ROOT, 'QLearningAndRL'))
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _load(path):
+    # The game files live in folders that are not packages (and one has a '*' in its name), so they are imported by path
+    if path not in _modules:
+        spec = importlib.util.spec_from_file_location('tournament_%d' % len(_modules), os.path.join(ROOT, path))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[path] = module
+    return _modules[path]
+
+
+def _play_pygame(strategy, seed, w, h, max_steps):
+    path, ai_class = STRATEGIES[strategy]
+    module = _load(path)
+    game = module.SnakeGame(w, h, seed=seed, render=False)
+    ai = getattr(module, ai_class)(game) if ai_class else None
+    latencies = np.zeros(max_steps, dtype=np.int64)
+    clock = time.perf_counter_ns
+    steps = 0
+    game_over = False
+    while not game_over and steps < max_steps:
+        start = clock()
+        if ai is not None:
+            game.direction = ai.get_next_move()
+        game_over, score = game.play_step()
+        latencies[steps] = clock() - start
+        steps += 1
+    # play_step ends the game with food None once the snake covers the whole board
+    return game.score, steps, game.food is None, not game_over, latencies[:steps]
+
+
+def _play_rl(model_path, seed, w, h, max_steps):
+    from SnakeGame import VecSnakeEnv
+    from agent import load_policy
+    if model_path not in _policies:
+        _policies[model_path] = load_policy(model_path)
+    net = _policies[model_path]
+    env = VecSnakeEnv(1, w, h, seed=seed)
+    states = env.get_states()
+    latencies = np.zeros(max_steps, dtype=np.int64)
+    clock = time.perf_counter_ns
+    steps = 0
+    done = False
+    while not done and steps < max_steps:
+        start = clock()
+        states, _, dones = env.step(np.argmax(net(states), axis=1))
+        latencies[steps] = clock() - start
+        steps += 1
+        done = bool(dones[0])
+    # VecSnakeEnv resets a finished game straight away, its final score is kept in episode_scores
+    score = int(env.episode_scores[0]) if done else int(env.score[0])
+    # The snake starts 3 long, so eating every other cell fills the board
+    return score, steps, score == env.n_cells - 3, not done, latencies[:steps]
+
+
+def play_game(strategy, seed, w, h, max_steps, model_path=None):
+    # Plays one headless game and returns its result with the move latencies already binned
+    if strategy == 'rl':
+        score, steps, won, timed_out, latencies = _play_rl(model_path, seed, w, h, max_steps)
+    else:
+        score, steps, won, timed_out, latencies = _play_pygame(strategy, seed, w, h, max_steps)
+    latencies = np.clip(latencies, LATENCY_BINS_NS[0], LATENCY_BINS_NS[-1])
+    return {
+        'seed': seed,
+        'score': int(score),
+        'steps': steps,
+        'won': bool(won),
+        'timed_out': bool(timed_out),
+        'latency_counts': np.histogram(latencies, LATENCY_BINS_NS)[0],
+        'latency_max_ns': int(latencies.max()) if steps else 0,
+    }
+
+
+def _latency_percentile(counts, q):
+    # Upper edge of the bin the q-th percentile move falls in, in microseconds
+    total = counts.sum()
+    if total == 0:
+        return None
+    i = int(np.searchsorted(np.cumsum(counts), q / 100 * total))
+    return round(float(LATENCY_BINS_NS[i + 1]) / 1000, 2)
+
+
+def summarize(results, elapsed):
+    scores = np.array([r['score'] for r in results])
+    fill_steps = np.array([r['steps'] for r in results if r['won']])
+    counts = np.sum([r['latency_counts'] for r in results], axis=0)
+    moves = int(sum(r['steps'] for r in results))
+    return {
+        'games': len(results),
+        'wins': int(len(fill_steps)),
+        'win_rate': round(len(fill_steps) / len(results), 4),
+        'timeouts': sum(r['timed_out'] for r in results),
+        'score': {
+            'mean': round(float(scores.mean()), 3),
+            'std': round(float(scores.std()), 3),
+            'min': int(scores.min()),
+            'p50': float(np.percentile(scores, 50)),
+            'p90': float(np.percentile(scores, 90)),
+            'max': int(scores.max()),
+        },
+        # Only games that filled the board count towards the steps it took
+        'steps_to_fill': None if not len(fill_steps) else {
+            'mean': round(float(fill_steps.mean()), 3),
+            'min': int(fill_steps.min()),
+            'p50': float(np.percentile(fill_steps, 50)),
+            'max': int(fill_steps.max()),
+        },
+        'latency_us': {
+            'p50': _latency_percentile(counts, 50),
+            'p90': _latency_percentile(counts, 90),
+            'p99': _latency_percentile(counts, 99),
+            'max': round(max(r['latency_max_ns'] for r in results) / 1000, 2),
+        },
+        'moves': moves,
+        'moves_per_sec': round(moves / elapsed, 1),
+        'games_per_sec': round(len(results) / elapsed, 3),
+        'seconds': round(elapsed, 3),
+    }
+
+
+def run_tournament(strategies, n_games=100, seed=0, workers=None, w=640, h=480, max_steps=None, model_path=None):
+    # Every strategy plays the same seeds seed, seed + 1, ... so they all see the same food sequence on each game
+    if max_steps is None:
+        # Enough for a plain Hamiltonian cycle to fill the board, which takes under cells / 2 steps per food on average
+        cells = (w // 20) * (h // 20)
+        max_steps = cells * cells
+    seeds = list(range(seed, seed + n_games))
+    workers = workers or os.cpu_count()
+    report = {'width': w, 'height': h, 'games': n_games, 'seed': seed, 'workers': workers, 'max_steps': max_steps,
+              'strategies': {}}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for strategy in strategies:
+            start = time.perf_counter()
+            results = list(executor.map(play_game, [strategy] * n_games, seeds, [w] * n_games, [h] * n_games,
+                                        [max_steps] * n_games, [model_path] * n_games))
+            report['strategies'][strategy] = summarize(results, time.perf_counter() - start)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Play seeded headless games with every snake AI and report stats as JSON')
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=None,
+                        help='strategies to run (default: all, rl only when --model is given)')
+    parser.add_argument('--games', type=int, default=100, help='games per strategy')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--width', type=int, default=640, help='board width in pixels')
+    parser.add_argument('--height', type=int, default=480, help='board height in pixels')
+    parser.add_argument('--max-steps', type=int, default=None,
+                        help='stop a game after this many moves (default: cells squared)')
+    parser.add_argument('--model', metavar='PATH',
+                        help='trained QLearningAndRL model (.pth or .npz) for the rl strategy')
+    parser.add_argument('--output', metavar='PATH', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    strategies = args.strategies or [s for s in STRATEGIES if s != 'rl' or args.model]
+    if 'rl' in strategies and not args.model:
+        parser.error('the rl strategy needs --model')
+    report = run_tournament(strategies, args.games, args.seed, args.workers, args.width, args.height, args.max_steps,
+                            args.model)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)